@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for GsData on synthetic splats.
+
+    $ python benchmark_gs.py load --sizes 1000000 5000000
+
+Every case runs in a fresh process so that the reported peak RSS belongs to that case only.
+"""
+import argparse
+import functools
+import multiprocessing as mp
+import os
+import resource
+import tempfile
+import time
+
+import numpy as np
+
+from ply_utils import format_ply_header, gaussian_property_names
+
+
+def synthetic_dtype(sh_degree: int = 3) -> np.dtype:
+    names = gaussian_property_names(3 * ((sh_degree + 1) ** 2 - 1))
+    return np.dtype([(name, '<f4') for name in names])
+
+
+def write_synthetic_ply(path: str, n: int, sh_degree: int = 3, chunk_size: int = 1 << 18, seed: int = 0):
+    """
+    Write a random 3DGS ply with `n` gaussians, chunk by chunk so memory stays bounded.
+    """
+    rng = np.random.default_rng(seed)
+    dtype = synthetic_dtype(sh_degree)
+    num_cols = len(dtype.names)
+    with open(path, "wb") as fid:
+        fid.write(format_ply_header(n, dtype))
+        for start in range(0, n, chunk_size):
+            m = min(chunk_size, n - start)
+            rows = rng.standard_normal((m, num_cols), dtype=np.float32)
+            rows[:, 0:3] *= 10.0  # xyz
+            rows[:, 3:6] = 0.0  # normals
+            rows[:, -7:-4] = rows[:, -7:-4] * 0.5 - 4.0  # log scales
+            rows[:, -4:] /= np.linalg.norm(rows[:, -4:], axis=1, keepdims=True)  # quaternions
+            rows.tofile(fid)
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _load_plyfile(path):
+    from insert_canvas_in_garden import GsData
+    GsData().load_from_ply(path)
+
+
+def _load_mmap(path):
+    from insert_canvas_in_garden import GsData
+    GsData().load_from_ply_mmap(path)
+
+
+def _load_mmap_touch(path):
+    from insert_canvas_in_garden import GsData
+    gs = GsData()
+    gs.load_from_ply_mmap(path)
+    for attr in (gs.xyz, gs.opacities, gs.features_dc, gs.features_rest, gs.scales, gs.rotations):
+        attr.sum()
+
+
+PLACEMENT = dict(scale=0.06, rpy_deg=[80, -180, 30], translation=(0.05, -0.3, 0.6))
+
+
+def _transform_case(transform, path):
+    """
+    Measure only the transform itself, not the load before it.
+    """
+    from insert_canvas_in_garden import GsData
+    gs = GsData()
+    gs.load_from_ply_packed(path)
+    base = peak_rss_mb()
+    t0 = time.perf_counter()
+    transform(gs, gs.deg2rad(PLACEMENT["rpy_deg"]))
+    return time.perf_counter() - t0, peak_rss_mb() - base
+
+
+def _three_calls(gs, rpy_rad):
+    # rescale -> rotate -> translation as they were before `apply_transform`: one full size pass
+    # and temporary per step, SH rotated through a concatenated [n, 16, 3] copy
+    gs.xyz = gs.xyz * PLACEMENT["scale"]
+    gs.scales = gs.scales + np.log(PLACEMENT["scale"])
+
+    quaternion = gs.rpy2qvec(rpy_rad)
+    rot_mat = gs.qvec2rotmat(quaternion)
+    gs.xyz = (rot_mat @ gs.xyz.T).T
+    rotations = gs.quat_multiply(gs.rotations, quaternion)
+    gs.rotations = rotations / np.linalg.norm(rotations, axis=-1, keepdims=True)
+    features = np.concatenate((gs.features_dc, gs.features_rest), axis=2).transpose((0, 2, 1))
+    features = gs.transform_shs(features, rot_mat)
+    gs.features_rest = features[:, 1:, :].transpose((0, 2, 1))
+
+    gs.xyz = gs.xyz + np.array(PLACEMENT["translation"])
+
+
+def _fused(gs, rpy_rad, workers=1):
+    gs.apply_transform(PLACEMENT["scale"], rpy_rad, PLACEMENT["translation"], workers=workers)
+
+
+TRANSFORM_CASES = {
+    "three calls": functools.partial(_transform_case, _three_calls),
+    "apply_transform": functools.partial(_transform_case, _fused),
+}
+
+
+LOAD_CASES = {
+    "plyfile": _load_plyfile,
+    "mmap": _load_mmap,
+    "mmap+touch": _load_mmap_touch,
+}
+
+
+def _run_case(fn, args, queue):
+    import insert_canvas_in_garden  # noqa: F401, keep import cost out of the measurement
+    base = peak_rss_mb()
+    t0 = time.perf_counter()
+    measured = fn(*args)
+    # cases may measure themselves and return (seconds, peak rss increase) to exclude their setup
+    queue.put(measured or (time.perf_counter() - t0, peak_rss_mb() - base))
+
+
+def run_isolated(fn, *args):
+    """
+    Run `fn(*args)` in a spawned process, return (seconds, peak rss increase in MB).
+    """
+    ctx = mp.get_context("spawn")
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_run_case, args=(fn, args, queue))
+    proc.start()
+    result = queue.get()
+    proc.join()
+    return result
+
+
+def report(name: str, n: int, seconds: float, rss_mb: float):
+    print(f"{name:<16} n={n:>10,}  {seconds:9.3f} s  peak rss +{rss_mb:9.1f} MB")
+
+
+def _bench_cases(args, cases):
+    for n in args.sizes:
+        path = os.path.join(args.workdir, f"synthetic_{n}.ply")
+        write_synthetic_ply(path, n)
+        print(f"--- {path} ({os.path.getsize(path) / 2**20:.1f} MB)")
+        for name, fn in cases.items():
+            report(name, n, *run_isolated(fn, path))
+        os.remove(path)
+
+
+def bench_load(args):
+    _bench_cases(args, LOAD_CASES)
+
+
+def bench_transform(args):
+    cases = dict(TRANSFORM_CASES)
+    if args.workers > 1:
+        cases[f"apply_transform x{args.workers}"] = functools.partial(
+            _transform_case, functools.partial(_fused, workers=args.workers))
+    _bench_cases(args, cases)
+
+
+def bench_compress(args):
+    from compressed_ply import roundtrip_report
+    from insert_canvas_in_garden import GsData
+
+    for n in args.sizes:
+        path = os.path.join(args.workdir, f"synthetic_{n}.ply")
+        write_synthetic_ply(path, n)
+        gs = GsData()
+        gs.load_from_ply_packed(path)
+        out_path = os.path.join(args.workdir, f"synthetic_{n}.compressed.ply")
+        t0 = time.perf_counter()
+        gs.save_to_compressed_ply(out_path)
+        seconds = time.perf_counter() - t0
+        print(f"--- n={n:,}: {os.path.getsize(path) / 2**20:.1f} MB -> "
+              f"{os.path.getsize(out_path) / 2**20:.1f} MB in {seconds:.3f} s")
+        for name, value in roundtrip_report(gs).items():
+            if name == "size_ratio":
+                print(f"{name:<16} {value:.2f}x")
+            else:
+                print(f"{name:<16} max abs error {value[0]:.5f}  mean abs error {value[1]:.5f}")
+        os.remove(path)
+        os.remove(out_path)
+
+
+def bench_load_many(args):
+    from insert_canvas_in_garden import GsData
+
+    paths = []
+    for i, n in enumerate(args.sizes):
+        paths.append(os.path.join(args.workdir, f"synthetic_{i}_{n}.ply"))
+        write_synthetic_ply(paths[-1], n, seed=i)
+    for workers in (1, args.workers):
+        t0 = time.perf_counter()
+        _, timings = GsData.load_many(paths, max_workers=workers)
+        print(f"--- {len(paths)} files, {workers} workers: {time.perf_counter() - t0:.3f} s")
+        for timing in timings:
+            print(f"{os.path.basename(timing['path']):<28} queued {timing['queued']:7.3f} s  "
+                  f"load {timing['load']:7.3f} s  {timing['throughput']:8.1f} MB/s")
+    for path in paths:
+        os.remove(path)
+
+
+def bench_merge(args, object_size: int = 100_000):
+    """
+    Insert a transformed object into each scene size: decode, merge and re-encode everything
+    against `merge_into_ply`, which only copies the scene bytes.
+    """
+    from insert_canvas_in_garden import GsData
+
+    obj_path = os.path.join(args.workdir, "synthetic_object.ply")
+    write_synthetic_ply(obj_path, object_size, seed=1)
+    obj = GsData()
+    obj.load_from_ply_packed(obj_path)
+    obj.apply_transform(PLACEMENT["scale"], obj.deg2rad(PLACEMENT["rpy_deg"]), PLACEMENT["translation"])
+    out_path = os.path.join(args.workdir, "synthetic_merged.ply")
+
+    for n in args.sizes:
+        path = os.path.join(args.workdir, f"synthetic_{n}.ply")
+        write_synthetic_ply(path, n)
+        size_mb = os.path.getsize(path) / 2**20
+        print(f"--- scene n={n:,} ({size_mb:.1f} MB) + object n={object_size:,}")
+
+        t0 = time.perf_counter()
+        scene = GsData()
+        scene.load_from_ply(path)
+        GsData.merge([scene, obj]).save_to_ply(out_path)
+        seconds = time.perf_counter() - t0
+        del scene
+        print(f"{'decode+merge':<16} {seconds:9.3f} s")
+
+        t0 = time.perf_counter()
+        obj.merge_into_ply(path, out_path)
+        seconds = time.perf_counter() - t0
+        print(f"{'merge_into_ply':<16} {seconds:9.3f} s  {size_mb / seconds:8.1f} MB/s")
+        os.remove(path)
+    os.remove(out_path)
+    os.remove(obj_path)
+
+
+def _outlier_case(path, workers):
+    from insert_canvas_in_garden import GsData
+    gs = GsData()
+    gs.load_from_ply_packed(path)
+    base = peak_rss_mb()
+    t0 = time.perf_counter()
+    kept = gs.remove_outliers(workers=workers)
+    print(f"{'':<16} kept {len(kept.xyz):,} of {len(gs.xyz):,}")
+    return time.perf_counter() - t0, peak_rss_mb() - base
+
+
+def bench_outliers(args):
+    cases = {f"knn x{workers}": functools.partial(_outlier_case, workers=workers)
+             for workers in sorted({1, args.workers})}
+    _bench_cases(args, cases)
+
+
+def _rotmat2qvec_eigh(R):
+    # the single matrix conversion `quat_utils.rotmat2qvec` replaced
+    Rxx, Ryx, Rzx, Rxy, Ryy, Rzy, Rxz, Ryz, Rzz = R.flat
+    K = np.array([
+        [Rxx - Ryy - Rzz, 0, 0, 0],
+        [Ryx + Rxy, Ryy - Rxx - Rzz, 0, 0],
+        [Rzx + Rxz, Rzy + Ryz, Rzz - Rxx - Ryy, 0],
+        [Ryz - Rzy, Rzx - Rxz, Rxy - Ryx, Rxx + Ryy + Rzz]]) / 3.0
+    eigvals, eigvecs = np.linalg.eigh(K)
+    qvec = eigvecs[[3, 0, 1, 2], np.argmax(eigvals)]
+    return -qvec if qvec[0] < 0 else qvec
+
+
+def bench_quat(args, loop_sample: int = 10_000):
+    """
+    Batched quaternion helpers against a python loop of single conversions. The loop only runs on
+    `loop_sample` items and is scaled to n.
+    """
+    import quat_utils
+
+    def timed(fn, *fn_args):
+        t0 = time.perf_counter()
+        result = fn(*fn_args)
+        return time.perf_counter() - t0, result
+
+    for n in args.sizes:
+        rng = np.random.default_rng(0)
+        q0 = quat_utils.normalize(rng.normal(size=(n, 4)))
+        q1 = quat_utils.normalize(rng.normal(size=(n, 4)))
+        sample = min(n, loop_sample)
+        print(f"--- n={n:,} (loops timed on {sample:,} and scaled)")
+
+        seconds, rot_mats = timed(quat_utils.qvec2rotmat, q0)
+        loop, _ = timed(lambda: [quat_utils.qvec2rotmat(q) for q in q0[:sample]])
+        print(f"{'qvec2rotmat':<16} batched {seconds:8.3f} s  loop {loop * n / sample:8.3f} s")
+
+        seconds, qvecs = timed(quat_utils.rotmat2qvec, rot_mats)
+        loop, looped = timed(lambda: np.stack([_rotmat2qvec_eigh(m) for m in rot_mats[:sample]]))
+        error = np.abs(qvecs[:sample] - looped).max()
+        print(f"{'rotmat2qvec':<16} batched {seconds:8.3f} s  eigh loop {loop * n / sample:8.3f} s  "
+              f"max diff {error:.1e}")
+
+        for name, fn, fn_args in [("multiply", quat_utils.multiply, (q0, q1)),
+                                  ("normalize", quat_utils.normalize, (q0,)),
+                                  ("slerp", quat_utils.slerp, (q0, q1, 0.3))]:
+            seconds, _ = timed(fn, *fn_args)
+            print(f"{name:<16} batched {seconds:8.3f} s")
+
+
+BENCHMARKS = {
+    "load": bench_load,
+    "compress": bench_compress,
+    "load_many": bench_load_many,
+    "transform": bench_transform,
+    "quat": bench_quat,
+    "merge": bench_merge,
+    "outliers": bench_outliers,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GsData benchmarks on synthetic splats")
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000_000, 5_000_000],
+                        help="number of gaussians")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="thread pool size")
+    parser.add_argument("--workdir", default=tempfile.gettempdir(), help="where the synthetic ply files go")
+    args = parser.parse_args()
+    BENCHMARKS[args.benchmark](args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""
+Quantized, chunked splat ply in the layout of the PlayCanvas / SuperSplat compressed ply:
+
+    element chunk   per 256 gaussians: min/max of position, log scale and base color (18 float)
+    element vertex  packed_position (11/10/11 bits), packed_rotation (2 + 3x10 bits, smallest three),
+                    packed_scale (11/10/11 bits), packed_color (8/8/8/8 bits, rgb + opacity)
+    element sh      f_rest_* as uchar
+
+Gaussians are Morton sorted before chunking so that the per chunk bounds stay tight.
+"""
+import numpy as np
+from plyfile import PlyData, PlyElement
+
+from gs_utils import SH_C0, sigmoid
+from morton import morton_order
+from ply_utils import gaussian_property_names
+
+CHUNK_SIZE = 256
+SCALE_CLAMP = 20.0
+
+CHUNK_PROPERTIES = [
+    'min_x', 'min_y', 'min_z', 'max_x', 'max_y', 'max_z',
+    'min_scale_x', 'min_scale_y', 'min_scale_z', 'max_scale_x', 'max_scale_y', 'max_scale_z',
+    'min_r', 'min_g', 'min_b', 'max_r', 'max_g', 'max_b',
+]
+VERTEX_PROPERTIES = ['packed_position', 'packed_rotation', 'packed_scale', 'packed_color']
+
+# for every largest component index, the indices of the three stored components
+_SMALLEST_THREE = np.array([[1, 2, 3], [0, 2, 3], [0, 1, 3], [0, 1, 2]])
+
+
+def pack_unorm(value: np.ndarray, bits: int) -> np.ndarray:
+    top = (1 << bits) - 1
+    return np.clip(np.floor(value * top + 0.5), 0, top).astype(np.uint32)
+
+
+def unpack_unorm(value: np.ndarray, bits: int) -> np.ndarray:
+    top = (1 << bits) - 1
+    return (value & top).astype(np.float32) / top
+
+
+def pack_111011(v: np.ndarray) -> np.ndarray:
+    return (pack_unorm(v[:, 0], 11) << 21) | (pack_unorm(v[:, 1], 10) << 11) | pack_unorm(v[:, 2], 11)
+
+
+def unpack_111011(v: np.ndarray) -> np.ndarray:
+    return np.stack([unpack_unorm(v >> 21, 11), unpack_unorm(v >> 11, 10), unpack_unorm(v, 11)], axis=1)
+
+
+def pack_8888(v: np.ndarray) -> np.ndarray:
+    return (pack_unorm(v[:, 0], 8) << 24) | (pack_unorm(v[:, 1], 8) << 16) | \
+        (pack_unorm(v[:, 2], 8) << 8) | pack_unorm(v[:, 3], 8)
+
+
+def unpack_8888(v: np.ndarray) -> np.ndarray:
+    return np.stack([unpack_unorm(v >> shift, 8) for shift in (24, 16, 8, 0)], axis=1)
+
+
+def pack_rotation(qvec: np.ndarray) -> np.ndarray:
+    """
+    Smallest-three encoding of wxyz quaternions [n, 4]: 2 bits for the index of the largest
+    component (in xyzw order), then the other three in 10 bits each.
+    """
+    q = qvec[:, [1, 2, 3, 0]].astype(np.float64)
+    q /= np.linalg.norm(q, axis=1, keepdims=True)
+    largest = np.argmax(np.abs(q), axis=1)
+    q *= np.where(np.take_along_axis(q, largest[:, None], axis=1) < 0, -1.0, 1.0)
+
+    others = np.take_along_axis(q, _SMALLEST_THREE[largest], axis=1) * (np.sqrt(2) * 0.5) + 0.5
+    return (largest.astype(np.uint32) << 30) | (pack_unorm(others[:, 0], 10) << 20) | \
+        (pack_unorm(others[:, 1], 10) << 10) | pack_unorm(others[:, 2], 10)
+
+
+def unpack_rotation(v: np.ndarray) -> np.ndarray:
+    others = np.stack([unpack_unorm(v >> 20, 10), unpack_unorm(v >> 10, 10), unpack_unorm(v, 10)], axis=1)
+    others = (others - 0.5) / (np.sqrt(2) * 0.5)
+    largest = (v >> 30).astype(np.intp)
+
+    q = np.empty((len(v), 4), dtype=np.float32)
+    np.put_along_axis(q, _SMALLEST_THREE[largest], others, axis=1)
+    np.put_along_axis(q, largest[:, None],
+                      np.sqrt(np.maximum(1.0 - np.sum(others ** 2, axis=1), 0.0))[:, None], axis=1)
+    return q[:, [3, 0, 1, 2]]
+
+
+def _normalize_in_chunks(values: np.ndarray, chunk_ids: np.ndarray, starts: np.ndarray):
+    """
+    :return: (values scaled to [0, 1] within their chunk, chunk minima, chunk maxima)
+    """
+    lo = np.minimum.reduceat(values, starts, axis=0)
+    hi = np.maximum.reduceat(values, starts, axis=0)
+    extent = np.where(hi > lo, hi - lo, 1.0)
+    return (values - lo[chunk_ids]) / extent[chunk_ids], lo, hi
+
+
+def compress(gs, sort: bool = True):
+    """
+    Quantize a GsData into the (chunk, vertex, sh) element arrays of a compressed ply.
+
+    :return: (chunk, vertex, sh or None, order), where `order` is the permutation of the input
+        gaussians stored in the file
+    """
+    n = gs.xyz.shape[0]
+    if n == 0:
+        chunk = np.empty(0, dtype=[(name, '<f4') for name in CHUNK_PROPERTIES])
+        vertex = np.empty(0, dtype=[(name, '<u4') for name in VERTEX_PROPERTIES])
+        return chunk, vertex, None, np.zeros(0, dtype=np.int64)
+    order = morton_order(gs.xyz) if sort else np.arange(n)
+    starts = np.arange(0, n, CHUNK_SIZE)
+    chunk_ids = np.arange(n) // CHUNK_SIZE
+
+    xyz = gs.xyz[order].astype(np.float32)
+    scales = np.clip(gs.scales[order], -SCALE_CLAMP, SCALE_CLAMP).astype(np.float32)
+    rgb = (gs.features_dc[order].reshape((n, 3)) * SH_C0 + 0.5).astype(np.float32)
+    alpha = sigmoid(gs.opacities[order].reshape((n, 1)).astype(np.float32))
+
+    xyz, xyz_lo, xyz_hi = _normalize_in_chunks(xyz, chunk_ids, starts)
+    scales, scale_lo, scale_hi = _normalize_in_chunks(scales, chunk_ids, starts)
+    rgb, rgb_lo, rgb_hi = _normalize_in_chunks(rgb, chunk_ids, starts)
+
+    chunk = np.empty(len(starts), dtype=[(name, '<f4') for name in CHUNK_PROPERTIES])
+    chunk_columns = np.concatenate([xyz_lo, xyz_hi, scale_lo, scale_hi, rgb_lo, rgb_hi], axis=1)
+    for i, name in enumerate(CHUNK_PROPERTIES):
+        chunk[name] = chunk_columns[:, i]
+
+    vertex = np.empty(n, dtype=[(name, '<u4') for name in VERTEX_PROPERTIES])
+    vertex['packed_position'] = pack_111011(xyz)
+    vertex['packed_rotation'] = pack_rotation(gs.rotations[order])
+    vertex['packed_scale'] = pack_111011(scales)
+    vertex['packed_color'] = pack_8888(np.concatenate([rgb, alpha], axis=1))
+
+    sh = None
+    if gs.sh_degrees > 0 and gs.features_rest.size > 0:
+        f_rest = gs.features_rest[order].reshape((n, -1))
+        sh = np.empty(n, dtype=[(f'f_rest_{i}', 'u1') for i in range(f_rest.shape[1])])
+        quantized = np.clip(np.floor((f_rest / 8.0 + 0.5) * 256.0), 0, 255).astype(np.uint8)
+        for i in range(f_rest.shape[1]):
+            sh[f'f_rest_{i}'] = quantized[:, i]
+    return chunk, vertex, sh, order
+
+
+def decompress(chunk: np.ndarray, vertex: np.ndarray, sh: np.ndarray = None) -> dict:
+    """
+    Inverse of `compress`, returns float32 GsData attributes keyed by attribute name.
+    """
+    n = len(vertex)
+    chunk_ids = np.arange(n) // CHUNK_SIZE
+    bounds = np.stack([chunk[name] for name in CHUNK_PROPERTIES], axis=1)[chunk_ids]
+
+    def denormalize(t, lo):
+        return bounds[:, lo:lo + 3] + t * (bounds[:, lo + 3:lo + 6] - bounds[:, lo:lo + 3])
+
+    color = unpack_8888(vertex['packed_color'])
+    alpha = np.clip(color[:, 3:], 0.5 / 255, 1.0 - 0.5 / 255)
+    attributes = {
+        "xyz": denormalize(unpack_111011(vertex['packed_position']), 0),
+        "scales": denormalize(unpack_111011(vertex['packed_scale']), 6),
+        "rotations": unpack_rotation(vertex['packed_rotation']),
+        "features_dc": ((denormalize(color[:, :3], 12) - 0.5) / SH_C0)[..., np.newaxis],
+        "opacities": -np.log(1.0 / alpha - 1.0),
+        "features_rest": np.zeros((n, 3, 0), dtype=np.float32),
+    }
+    if sh is not None:
+        quantized = np.stack([sh[name] for name in sh.dtype.names], axis=1)
+        attributes["features_rest"] = ((quantized + 0.5) / 256.0 - 0.5) * 8.0
+        attributes["features_rest"] = attributes["features_rest"].reshape((n, 3, -1))
+    return {key: value.astype(np.float32) for key, value in attributes.items()}
+
+
+def write_compressed_ply(path: str, gs, sort: bool = True) -> np.ndarray:
+    """
+    :return: the permutation of the gaussians stored in the file
+    """
+    chunk, vertex, sh, order = compress(gs, sort)
+    elements = [PlyElement.describe(chunk, 'chunk'), PlyElement.describe(vertex, 'vertex')]
+    if sh is not None:
+        elements.append(PlyElement.describe(sh, 'sh'))
+    PlyData(elements).write(path)
+    return order
+
+
+def read_compressed_ply(path: str) -> dict:
+    plydata = PlyData.read(path)
+    sh = plydata['sh'].data if 'sh' in plydata else None
+    return decompress(plydata['chunk'].data, plydata['vertex'].data, sh)
+
+
+def roundtrip_report(gs) -> dict:
+    """
+    Compress and decompress in memory and measure the error per attribute, plus the size ratio
+    against the full float ply.
+
+    :return: {attribute: (max abs error, mean abs error)}, rotations as angles in degrees and
+        opacities after the sigmoid, plus "size_ratio"; all zeros for an empty GsData
+    """
+    if gs.xyz.shape[0] == 0:
+        names = ["xyz", "scales", "features_dc", "features_rest", "opacities", "rotations"]
+        return dict({name: (0.0, 0.0) for name in names}, size_ratio=0.0)
+    chunk, vertex, sh, order = compress(gs)
+    decoded = decompress(chunk, vertex, sh)
+
+    report = {}
+    for name in ["xyz", "scales", "features_dc", "features_rest"]:
+        error = np.abs(decoded[name] - getattr(gs, name)[order])
+        report[name] = (float(error.max(initial=0.0)), float(error.mean()) if error.size else 0.0)
+
+    error = np.abs(sigmoid(decoded["opacities"]) - sigmoid(gs.opacities[order]))
+    report["opacities"] = (float(error.max()), float(error.mean()))
+
+    q = gs.rotations[order] / np.linalg.norm(gs.rotations[order], axis=1, keepdims=True)
+    dot = np.clip(np.abs(np.sum(q * decoded["rotations"], axis=1)), 0.0, 1.0)
+    angle = np.degrees(2.0 * np.arccos(dot))
+    report["rotations"] = (float(angle.max()), float(angle.mean()))
+
+    num_rest = 0 if sh is None else len(sh.dtype.names)
+    compressed_bytes = chunk.nbytes + vertex.nbytes + (0 if sh is None else sh.nbytes)
+    report["size_ratio"] = len(gaussian_property_names(num_rest)) * 4 * len(vertex) / compressed_bytes
+    return report
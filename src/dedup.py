@@ -0,0 +1,66 @@
+"""
+Near duplicate removal, e.g. on the seam between an inserted object and the scene.
+
+Two gaussians are duplicates when their centers are within `radius`, their base colors (DC) within
+`color_tol` and their log scales within `scale_tol`. Candidates come from a `SpatialIndex` with cells
+of size `radius`: every gaussian is only compared with the gaussians of its own and the 26 neighboring
+cells. Duplicates are grouped transitively (connected components) and only the most opaque gaussian
+of a group is kept, so `radius` should stay below the spacing of distinct gaussians.
+"""
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+from gs_utils import SH_C0
+from spatial_index import SpatialIndex
+
+
+def duplicate_pairs(gs, radius: float, color_tol: float = 0.02, scale_tol: float = 0.2, split: int = None,
+                    chunk_size: int = 1 << 16) -> np.ndarray:
+    """
+    :param color_tol: largest difference of the base color, in rgb [0, 1] units
+    :param scale_tol: largest difference of the log scales
+    :param split: only pairs with one gaussian below and one at or above this row, e.g. the first
+        object row of a merge, so the scene and the object are not deduplicated on their own
+    :return: [k, 2] index pairs (i < j) of duplicates
+    """
+    xyz = gs.xyz.astype(np.float64)
+    n = len(xyz)
+    # with a split, index one side and query the other side only
+    indexed = np.arange(n) if split is None else np.arange(split)
+    queried = np.arange(n) if split is None else np.arange(split, n)
+    if len(indexed) == 0 or len(queried) == 0:
+        return np.zeros((0, 2), dtype=np.int64)
+    index = SpatialIndex.build(xyz[indexed], cell_size=radius)
+
+    color = gs.features_dc.reshape((n, -1)) * SH_C0
+    pairs = []
+    for start in range(0, len(queried), chunk_size):
+        query_rows = queried[start:start + chunk_size]
+        query, candidate = index.neighbors(xyz[query_rows])
+        i, j = query_rows[query], indexed[candidate]
+        keep = i != j if split is not None else i < j
+        i, j = i[keep], j[keep]
+        similar = np.sum((xyz[i] - xyz[j]) ** 2, axis=1) <= radius * radius
+        similar &= np.max(np.abs(color[i] - color[j]), axis=1) <= color_tol
+        similar &= np.max(np.abs(gs.scales[i] - gs.scales[j]), axis=1) <= scale_tol
+        pairs.append(np.stack([np.minimum(i, j), np.maximum(i, j)], axis=1)[similar])
+    # exact cell keys: every candidate pair is visited once, no duplicates to remove
+    return np.concatenate(pairs)
+
+
+def duplicates_mask(gs, pairs: np.ndarray) -> np.ndarray:
+    """
+    :return: [n] True for the gaussians to drop: all but the most opaque of every duplicate group
+    """
+    n = len(gs.xyz)
+    if len(pairs) == 0:
+        return np.zeros(n, dtype=bool)
+    graph = coo_matrix((np.ones(len(pairs), dtype=np.int8), (pairs[:, 0], pairs[:, 1])), shape=(n, n))
+    _, labels = connected_components(graph, directed=False)
+    # most opaque first, then the first of every label is the one kept
+    order = np.lexsort((-gs.opacities.reshape(-1), labels))
+    first = np.r_[True, labels[order][1:] != labels[order][:-1]]
+    drop = np.ones(n, dtype=bool)
+    drop[order[first]] = False
+    return drop
@@ -0,0 +1,121 @@
+"""
+Native on-disk cache of GsData: one raw .npy file per attribute plus a small header.json.
+
+    garden.ply.cache/
+        header.json     {"version", "sh_degrees", "count", "attributes", "source": {"size", "mtime_ns", "sha1"}}
+        xyz.npy
+        ...
+
+A GsData in the packed layout is cached as its single `buffer.npy` instead of one file per attribute.
+
+Reloading is an `np.load(mmap_mode=...)` per attribute. The cache is keyed on the source ply: it is
+valid while size and mtime match, and a changed mtime with identical size only costs a hash check
+(e.g. after a copy or `touch`), anything else means the cache is rebuilt.
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+
+CACHE_VERSION = 1
+ATTRIBUTES = ["xyz", "opacities", "features_dc", "features_rest", "scales", "rotations"]
+HEADER_NAME = "header.json"
+
+
+def default_cache_dir(ply_file_path: str) -> str:
+    return ply_file_path + ".cache"
+
+
+def file_sha1(path: str, block_size: int = 1 << 24) -> str:
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as fid:
+        for block in iter(lambda: fid.read(block_size), b""):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def source_fingerprint(path: str) -> dict:
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha1": file_sha1(path)}
+
+
+def read_header(cache_dir: str):
+    try:
+        with open(os.path.join(cache_dir, HEADER_NAME)) as fid:
+            header = json.load(fid)
+    except (OSError, ValueError):
+        return None
+    return header if header.get("version") == CACHE_VERSION else None
+
+
+def _write_header(cache_dir: str, header: dict):
+    tmp_path = os.path.join(cache_dir, HEADER_NAME + ".tmp")
+    with open(tmp_path, "w") as fid:
+        json.dump(header, fid, indent=2)
+    os.replace(tmp_path, os.path.join(cache_dir, HEADER_NAME))
+
+
+def is_valid(cache_dir: str, source_path: str) -> bool:
+    header = read_header(cache_dir)
+    if header is None:
+        return False
+    source = header.get("source")
+    # a cache saved without a source cannot be checked against the ply
+    if source is None:
+        return False
+    try:
+        stat = os.stat(source_path)
+    except FileNotFoundError:
+        return False
+    if stat.st_size != source["size"]:
+        return False
+    if stat.st_mtime_ns == source["mtime_ns"]:
+        return True
+    if file_sha1(source_path) != source["sha1"]:
+        return False
+    # same content, only the mtime moved: remember it so the next check is free again
+    source["mtime_ns"] = stat.st_mtime_ns
+    _write_header(cache_dir, header)
+    return True
+
+
+def save_cache(cache_dir: str, gs, source_path: str = None):
+    """
+    Write `gs` to `cache_dir`. The header is written last, so an interrupted save leaves an
+    invalid cache rather than a corrupt one.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    header_path = os.path.join(cache_dir, HEADER_NAME)
+    if os.path.exists(header_path):
+        os.remove(header_path)
+
+    attributes = {}
+    buffer = gs.packed_buffer()
+    arrays = {"buffer": buffer} if buffer is not None else {name: getattr(gs, name) for name in ATTRIBUTES}
+    for name, value in arrays.items():
+        value = np.ascontiguousarray(value)
+        np.save(os.path.join(cache_dir, name + ".npy"), value)
+        attributes[name] = {"shape": list(value.shape), "dtype": value.dtype.str}
+
+    _write_header(cache_dir, {
+        "version": CACHE_VERSION,
+        "sh_degrees": int(gs.sh_degrees),
+        "count": int(gs.xyz.shape[0]),
+        "attributes": attributes,
+        "source": None if source_path is None else source_fingerprint(source_path),
+    })
+
+
+def load_cache(cache_dir: str, mmap_mode: str = "c"):
+    """
+    :param mmap_mode: passed to `np.load`; the default copy-on-write mode lets the in place GsData
+        transforms work on the mapped arrays without ever touching the cache files
+    :return: (header, {attribute name, or "buffer" for the packed layout: memory-mapped array})
+    """
+    header = read_header(cache_dir)
+    if header is None:
+        raise ValueError(f"{cache_dir} is not a valid GsData cache")
+    arrays = {name: np.load(os.path.join(cache_dir, name + ".npy"), mmap_mode=mmap_mode)
+              for name in header["attributes"]}
+    return header, arrays
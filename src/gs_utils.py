@@ -0,0 +1,14 @@
+"""
+Activations and SH constants of the 3DGS ply attributes, shared by the GsData modules.
+
+    color   = SH_C0 * f_dc + 0.5    (degree 0, rgb in [0, 1])
+    alpha   = sigmoid(opacity)
+    scale   = exp(scale_*)
+"""
+import numpy as np
+
+SH_C0 = 0.28209479177387814
+
+
+def sigmoid(x: np.ndarray) -> np.ndarray:
+    return 1.0 / (1.0 + np.exp(-x))
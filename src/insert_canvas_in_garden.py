@@ -1,15 +1,38 @@
 import os
-import torch
+import threading
+import time
 import numpy as np
-from plyfile import PlyData, PlyElement
+from plyfile import PlyData
 from line_profiler import profile as lp
 from dataclasses import dataclass
 from scipy.spatial.transform import Rotation as R
 from typing import List
+from concurrent.futures import ThreadPoolExecutor
+
+import gs_cache
+import quat_utils
+import splat_formats
+from carving import Occupancy, carve_mask
+from compressed_ply import read_compressed_ply, write_compressed_ply
+from dedup import duplicate_pairs, duplicates_mask
+from gs_utils import SH_C0, sigmoid
+from morton import morton_order
+from outliers import statistical_inliers
+from ply_utils import (DEFAULT_CHUNK_SIZE, StreamingPlyWriter, bounds_path, copy_file_bytes, element_dtype,
+                       fields_view, format_ply_header, gaussian_property_names, iter_vertex_chunks,
+                       memmap_vertices, pack_rows, read_ply_header, replace_vertex_count, save_chunk_bounds,
+                       sh_degree_from_num_rest, sorted_property_names, write_ply)
+from parallel import PARALLEL_CHUNK_SIZE, run_chunked
+from pruning import budget_count, importance_scores, top_k
+from sh_rotation import rotate_sh, sh_rotation_matrix
+from spatial_index import INDEX_NAME as SPATIAL_INDEX_NAME, SpatialIndex
 
 
 @dataclass
 class GsData:
+    ATTRIBUTES = ("xyz", "opacities", "features_dc", "features_rest", "scales", "rotations")
+    _DEFERRED_LOCK = threading.Lock()
+
     def __init__(self):
 
         self.sh_degrees: int
@@ -19,239 +42,687 @@ class GsData:
         self.features_rest: np.ndarray  # ndarray[n, 3, 15], or tensor[n, 15, 3]; NOTE: this is features_rest actually!
         self.scales: np.ndarray  # [n, 3]
         self.rotations: np.ndarray  # [n, 4]
+        self.buffer: np.ndarray = None  # [n, num ply properties] float32 backing all attributes, packed layout only
 
     
     def qvec2rotmat(self, qvec):
-        return np.array([
-            [1 - 2 * qvec[2]**2 - 2 * qvec[3]**2,
-            2 * qvec[1] * qvec[2] - 2 * qvec[0] * qvec[3],
-            2 * qvec[3] * qvec[1] + 2 * qvec[0] * qvec[2]],
-            [2 * qvec[1] * qvec[2] + 2 * qvec[0] * qvec[3],
-            1 - 2 * qvec[1]**2 - 2 * qvec[3]**2,
-            2 * qvec[2] * qvec[3] - 2 * qvec[0] * qvec[1]],
-            [2 * qvec[3] * qvec[1] - 2 * qvec[0] * qvec[2],
-            2 * qvec[2] * qvec[3] + 2 * qvec[0] * qvec[1],
-            1 - 2 * qvec[1]**2 - 2 * qvec[2]**2]])
+        return quat_utils.qvec2rotmat(qvec)
 
     def rotmat2qvec(self, R):
-        Rxx, Ryx, Rzx, Rxy, Ryy, Rzy, Rxz, Ryz, Rzz = R.flat
-        K = np.array([
-            [Rxx - Ryy - Rzz, 0, 0, 0],
-            [Ryx + Rxy, Ryy - Rxx - Rzz, 0, 0],
-            [Rzx + Rxz, Rzy + Ryz, Rzz - Rxx - Ryy, 0],
-            [Ryz - Rzy, Rzx - Rxz, Rxy - Ryx, Rxx + Ryy + Rzz]]) / 3.0
-        eigvals, eigvecs = np.linalg.eigh(K)
-        qvec = eigvecs[[3, 0, 1, 2], np.argmax(eigvals)]
-        if qvec[0] < 0:
-            qvec *= -1
-        return qvec
+        return quat_utils.rotmat2qvec(R)
 
     def quat_multiply(self, quaternion0, quaternion1):
-        w0, x0, y0, z0 = np.split(quaternion0, 4, axis=-1)
-        w1, x1, y1, z1 = np.split(quaternion1, 4, axis=-1)
-        return np.concatenate((
-            -x1 * x0 - y1 * y0 - z1 * z0 + w1 * w0,
-            x1 * w0 + y1 * z0 - z1 * y0 + w1 * x0,
-            -x1 * z0 + y1 * w0 + z1 * x0 + w1 * y0,
-            x1 * y0 - y1 * x0 + z1 * w0 + w1 * z0,
-        ), axis=-1)
+        # quaternion1 * quaternion0: rotates the gaussians (quaternion0) by quaternion1
+        return quat_utils.multiply(quaternion1, quaternion0)
 
     def transform_shs(self, features, rotation_matrix):
         """
-        https://github.com/graphdeco-inria/gaussian-splatting/issues/176#issuecomment-2147223570
+        :param features: [n, 1 + K, 3], dc first
         """
-
-        try:
-            from e3nn import o3
-            import einops
-            from einops import einsum
-        except:
-            print("Please run `pip install e3nn einops` to enable SHs rotation")
-            return features
-
         if features.shape[1] == 1:
             return features
 
-        features = torch.from_numpy(features)
-        rotation_matrix = torch.from_numpy(rotation_matrix).to(torch.float32)
-
-        features = features.clone()
-
-        shs_feat = features[:, 1:, :]
-
-        ## rotate shs
-        P = torch.tensor([[0, 0, 1], [1, 0, 0], [0, 1, 0]], dtype=shs_feat.dtype, device=shs_feat.device)  # switch axes: yzx -> xyz
-        inversed_P = torch.tensor([
-            [0, 1, 0],
-            [0, 0, 1],
-            [1, 0, 0],
-        ], dtype=shs_feat.dtype, device=shs_feat.device)
-        
-        permuted_rotation_matrix = inversed_P @ rotation_matrix @ P
-        rot_angles = o3._rotation.matrix_to_angles(permuted_rotation_matrix.cpu())
-
-        # Construction coefficient
-        D_1 = o3.wigner_D(1, rot_angles[0], - rot_angles[1], rot_angles[2]).to(device=shs_feat.device)
-        D_2 = o3.wigner_D(2, rot_angles[0], - rot_angles[1], rot_angles[2]).to(device=shs_feat.device)
-        D_3 = o3.wigner_D(3, rot_angles[0], - rot_angles[1], rot_angles[2]).to(device=shs_feat.device)
-
-        # rotation of the shs features
-        one_degree_shs = shs_feat[:, 0:3]
-        one_degree_shs = einops.rearrange(one_degree_shs, 'n shs_num rgb -> n rgb shs_num')
-        one_degree_shs = einsum(
-            D_1,
-            one_degree_shs,
-            "... i j, ... j -> ... i",
-        )
-        one_degree_shs = einops.rearrange(one_degree_shs, 'n rgb shs_num -> n shs_num rgb')
-        shs_feat[:, 0:3] = one_degree_shs
-
-        if shs_feat.shape[1] >= 4:
-            two_degree_shs = shs_feat[:, 3:8]
-            two_degree_shs = einops.rearrange(two_degree_shs, 'n shs_num rgb -> n rgb shs_num')
-            two_degree_shs = einsum(
-                D_2,
-                two_degree_shs,
-                "... i j, ... j -> ... i",
-            )
-            two_degree_shs = einops.rearrange(two_degree_shs, 'n rgb shs_num -> n shs_num rgb')
-            shs_feat[:, 3:8] = two_degree_shs
-
-            if shs_feat.shape[1] >= 9:
-                three_degree_shs = shs_feat[:, 8:15]
-                three_degree_shs = einops.rearrange(three_degree_shs, 'n shs_num rgb -> n rgb shs_num')
-                three_degree_shs = einsum(
-                    D_3,
-                    three_degree_shs,
-                    "... i j, ... j -> ... i",
-                )
-                three_degree_shs = einops.rearrange(three_degree_shs, 'n rgb shs_num -> n shs_num rgb')
-                shs_feat[:, 8:15] = three_degree_shs
-
-        
-        return features.numpy()
-
-
-
-    def load_array_from_plyelement(self, plyelement, name_prefix: str, required: bool = True):
-            names = [p.name for p in plyelement.properties if p.name.startswith(name_prefix)]
-
-            names = sorted(names, key=lambda x: int(x.split('_')[-1]))
-            
-            v_list = [np.asarray(plyelement[attr_name]) for idx, attr_name in enumerate(names)]
-
-            return np.stack(v_list, axis=1)
+        features = features.copy()
+        degree = sh_degree_from_num_rest(3 * (features.shape[1] - 1))
+        rotate_sh(features[:, 1:, :].transpose((0, 2, 1)), sh_rotation_matrix(rotation_matrix, degree))
+        return features
 
+    def rpy2qvec(self, rpy: List):
+        # NOTE: scipy returns the quaternion scalar last, but `rotate` has always read it as wxyz. The
+        # placements tuned so far (e.g. `rpy` in __main__) rely on that, so it is kept on purpose.
+        return R.from_euler('xyz', rpy).as_quat()
 
     # @lp
-    def load_from_ply(self, ply_file_path: str):
+    def load_from_ply(self, ply_file_path: str, attributes: List[str] = None, sh_degree: int = None):
+        """
+        :param attributes: attributes to read now, default all of `ATTRIBUTES`; the others are read
+            from the file the first time they are accessed, so e.g. a bounding box only reads xyz
+        :param sh_degree: SH degree to keep (0-3), default the degree stored in the file. Higher bands
+            are never copied out of the file.
+        """
         plydata = PlyData.read(ply_file_path)
-        vertex = plydata['vertex'].data
-        self.sh_degrees = 3
+        self.load_from_vertices(plydata['vertex'].data, attributes=attributes, sh_degree=sh_degree, copy=True)
 
-        self.xyz = np.vstack([vertex['x'], vertex['y'], vertex['z']]).T
-        self.opacities = np.asarray(plydata.elements[0]["opacity"])[..., np.newaxis]
+    def load_from_ply_mmap(self, ply_file_path: str, mode: str = "c", attributes: List[str] = None,
+                           sh_degree: int = None):
+        """
+        Same result as `load_from_ply`, but the vertex body is memory-mapped and every
+        attribute is a strided view into it. Nothing is copied until it is written
+        (copy-on-write, the file itself is never modified).
+        """
+        _, vertex = memmap_vertices(ply_file_path, mode=mode)
+        self.load_from_vertices(vertex, attributes=attributes, sh_degree=sh_degree)
 
-        self.features_dc = np.vstack([plydata.elements[0]["f_dc_0"], 
-                        plydata.elements[0]["f_dc_1"], 
-                        plydata.elements[0]["f_dc_2"]]).T[..., np.newaxis]
+    def load_from_vertices(self, vertex: np.ndarray, attributes: List[str] = None, sh_degree: int = None,
+                           copy: bool = False):
+        """
+        Point the attributes at the fields of a structured vertex array, as views unless `copy`.
+        Attributes left out of `attributes` are read from `vertex` on first access.
+        """
+        self._vertex = vertex
+        self._copy_vertex = copy
+        self.buffer = None
+        file_sh_degree = sh_degree_from_num_rest(len(sorted_property_names(vertex.dtype.names, "f_rest_")))
+        self.sh_degrees = file_sh_degree if sh_degree is None else min(sh_degree, file_sh_degree)
+
+        attributes = self.ATTRIBUTES if attributes is None else attributes
+        for name in self.ATTRIBUTES:
+            if name in attributes:
+                setattr(self, name, self.read_vertex_attribute(name))
+            else:
+                self.__dict__.pop(name, None)
+        self._release_vertex()
+
+    def _release_vertex(self):
+        # the vertex table is only kept while some attribute is still deferred
+        if all(name in self.__dict__ for name in self.ATTRIBUTES):
+            self._vertex = None
+
+    def read_vertex_attribute(self, name: str) -> np.ndarray:
+        vertex = self._vertex
+        names = vertex.dtype.names
+
+        if name == "xyz":
+            value = fields_view(vertex, ['x', 'y', 'z'])
+        elif name == "opacities":
+            value = fields_view(vertex, ['opacity'])
+        elif name == "features_dc":
+            value = fields_view(vertex, ['f_dc_0', 'f_dc_1', 'f_dc_2'])[..., np.newaxis]
+        elif name == "features_rest":
+            rest_names = sorted_property_names(names, "f_rest_")
+            if not rest_names:
+                return np.zeros((len(vertex), 3, 0), dtype=np.float32)
+            # f_rest_* is channel major: [n, 3, coefficients per channel], keep the low bands only
+            value = fields_view(vertex, rest_names).reshape((len(vertex), 3, len(rest_names) // 3))
+            value = value[:, :, :(self.sh_degrees + 1) ** 2 - 1]
+        elif name == "scales":
+            value = fields_view(vertex, sorted_property_names(names, "scale_"))
+        elif name == "rotations":
+            value = fields_view(vertex, sorted_property_names(names, "rot_"))
+        else:
+            raise KeyError(name)
+        return np.array(value) if self._copy_vertex else value
+
+    def __getattr__(self, name):
+        # only reached for attributes that are not set, i.e. the ones deferred by `load_from_vertices`;
+        # locked so that threads reading the same deferred attribute all get the one array loaded
+        if name in GsData.ATTRIBUTES:
+            with GsData._DEFERRED_LOCK:
+                if name in self.__dict__:
+                    return self.__dict__[name]
+                if self.__dict__.get("_vertex") is not None:
+                    value = self.read_vertex_attribute(name)
+                    setattr(self, name, value)
+                    self._release_vertex()
+                    return value
+        raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+
+    def load_from_ply_packed(self, ply_file_path: str):
+        """
+        Load into the packed layout (see `to_packed`). A standard all-float 3DGS ply is read with a
+        single copy of its vertex body, anything else goes through `load_from_ply_mmap`.
+        """
+        _, vertex = memmap_vertices(ply_file_path)
+        num_rest = len(sorted_property_names(vertex.dtype.names, "f_rest_"))
+        if list(vertex.dtype.names) == gaussian_property_names(num_rest) and \
+                all(vertex.dtype[name] == np.dtype('<f4') for name in vertex.dtype.names):
+            self.load_from_packed(np.array(vertex).view('<f4').reshape((len(vertex), len(vertex.dtype.names))))
+        else:
+            self.load_from_vertices(vertex)
+            self.to_packed()
 
-        self.features_rest = self.load_array_from_plyelement(plydata.elements[0], 
-                                                "f_rest_", required=False).reshape((self.xyz.shape[0], 
-                                                                                    self.sh_degrees, -1))
+    def load_from_packed(self, buffer: np.ndarray):
+        """
+        Adopt a [n, num ply properties] float32 buffer whose columns follow the saved ply property order.
+        """
+        num_rest = buffer.shape[1] - len(gaussian_property_names(0))
+        dtype = np.dtype([(name, '<f4') for name in gaussian_property_names(num_rest)])
+        buffer = np.ascontiguousarray(buffer, dtype='<f4')
+        self.load_from_vertices(buffer.view(dtype)[:, 0])
+        self.buffer = buffer
+        self._packed_views = {name: getattr(self, name) for name in self.ATTRIBUTES}
+
+    def packed_buffer(self):
+        """
+        The packed buffer while it still backs every attribute, else None: an attribute reassigned
+        since (e.g. `gs.xyz = gs.xyz * 2` rather than `gs.xyz *= 2`) only lives in its own array.
+        """
+        if self.buffer is None:
+            return None
+        if any(self.__dict__.get(name) is not view for name, view in self._packed_views.items()):
+            return None
+        return self.buffer
 
-        
-        self.scales = self.load_array_from_plyelement(plydata.elements[0], "scale_") #scale
-        self.rotations = self.load_array_from_plyelement(plydata.elements[0], "rot_") # quatenion
-        
+    def to_packed(self):
+        """
+        Switch to the packed layout: all attributes become float32 views into one contiguous buffer
+        laid out like a ply row (normals included), so saving is a single write and merging packed
+        scenes with the same SH degree is a single `np.concatenate` of their buffers.
+        """
+        dtype_full, groups = self.ply_layout()
+        rows = pack_rows(dtype_full, groups, 0, self.xyz.shape[0])
+        self.load_from_packed(rows.view('<f4').reshape((len(rows), rows.dtype.itemsize // 4)))
 
-    
-    def rescale(self, factor:float):
-        self.xyz = self.xyz * factor
-        # self.scales = self.scales * factor
-        self.scales += np.log(factor)
+    @classmethod
+    def empty(cls, count: int, sh_degrees: int = 3) -> "GsData":
+        """
+        Zero initialized GsData in the packed layout, e.g. a preallocated merge target for `instance`.
+        """
+        num_rest = 3 * ((sh_degrees + 1) ** 2 - 1)
+        return cls.from_packed(np.zeros((count, len(gaussian_property_names(num_rest))), dtype=np.float32))
 
-    def save_to_ply(self, path: str, with_colors: bool = False):
-        # os.makedirs(os.path.dirname(path), exist_ok=True)
+    @classmethod
+    def from_packed(cls, buffer: np.ndarray) -> "GsData":
+        gs = cls()
+        gs.load_from_packed(buffer)
+        return gs
 
-        xyz = self.xyz
-        normals = np.zeros_like(xyz)
-        f_dc = self.features_dc.reshape((self.features_dc.shape[0], -1))
+    def select(self, index) -> "GsData":
+        """
+        Subset by integer indices or a boolean mask, as a new GsData (packed if this one is).
+        """
+        buffer = self.packed_buffer()
+        if buffer is not None:
+            return type(self).from_packed(buffer[index])
+        gs = type(self)()
+        gs.sh_degrees = self.sh_degrees
+        for name in self.ATTRIBUTES:
+            setattr(gs, name, getattr(self, name)[index])
+        return gs
+
+    def remove_outliers(self, k: int = 20, std_ratio: float = 2.0, opacity_weighted: bool = False,
+                        workers: int = None) -> "GsData":
+        """
+        Drop gaussians whose mean distance to their `k` nearest neighbors is above mean + std_ratio * std,
+        see `outliers.statistical_inliers`.
 
-        if self.sh_degrees > 0:
-            f_rest = self.features_rest.reshape((self.features_rest.shape[0], -1))
+        :param opacity_weighted: divide the distances by the opacities, so faint floaters go first
+        """
+        weights = sigmoid(self.opacities) if opacity_weighted else None
+        return self.select(statistical_inliers(self.xyz, k, std_ratio, weights=weights, workers=workers))
+
+    def prune(self, count: int = None, max_bytes: int = None, with_colors: bool = False):
+        """
+        Keep the `count` most important gaussians (opacity times volume, see `pruning`), or as many as
+        fit in a `save_to_ply(with_colors=with_colors)` file of `max_bytes`.
+
+        :return: (pruned GsData, {"kept", "total", "energy_retained"})
+        """
+        if (count is None) == (max_bytes is None):
+            raise ValueError("give exactly one of count and max_bytes")
+        if count is None:
+            row_bytes = 4 * len(gaussian_property_names(3 * self.features_rest.shape[2])) + (3 if with_colors else 0)
+            count = budget_count(row_bytes, max_bytes)
+
+        scores = importance_scores(self.opacities, self.scales)
+        keep = top_k(scores, count)
+        total_energy = scores.sum()
+        report = {
+            "kept": len(keep),
+            "total": len(scores),
+            "energy_retained": float(scores[keep].sum() / total_energy) if total_energy > 0 else 1.0,
+        }
+        return self.select(keep), report
+
+    def carve(self, obj: "GsData", fade: float = None, voxel_size: float = None, dilation: int = 1,
+              index: SpatialIndex = None):
+        """
+        Deal with the gaussians of this scene that lie inside the (already placed) object `obj`, see
+        `carving`: removed by default, or their opacity multiplied by `fade` in place.
+
+        :param index: `spatial_index(...)` of this scene, to skip the bounding box scan
+        :return: (carved GsData, [n] mask of the gaussians that were inside), nothing is inside an
+            empty object
+        """
+        if obj.xyz.shape[0] == 0:
+            inside = np.zeros(self.xyz.shape[0], dtype=bool)
         else:
-            f_rest = np.zeros((f_dc.shape[0], 0))
+            occupancy = Occupancy(obj.xyz, obj.scales, voxel_size=voxel_size, dilation=dilation)
+            inside = carve_mask(self.xyz, occupancy, index=index)
+        if fade is None:
+            return self.select(~inside), inside
+        alpha = sigmoid(self.opacities[inside].astype(np.float64)) * fade
+        alpha = np.clip(alpha, 1e-6, 1.0 - 1e-6)
+        self.opacities[inside] = np.log(alpha / (1.0 - alpha))
+        return self, inside
+
+    def deduplicate(self, radius: float, color_tol: float = 0.02, scale_tol: float = 0.2, split: int = None):
+        """
+        Keep one gaussian of every group of near duplicates (close centers, base colors and scales),
+        see `dedup`.
+
+        :param split: only look for duplicates across this row, e.g. `len(scene.xyz)` on a merge of
+            scene and object to clean the seam only
+        :return: (deduplicated GsData, [n] mask of the dropped gaussians)
+        """
+        drop = duplicates_mask(self, duplicate_pairs(self, radius, color_tol, scale_tol, split=split))
+        return self.select(~drop), drop
+
+    @classmethod
+    def merge(cls, parts: List["GsData"], sh_degrees: int = None, out_path: str = None) -> "GsData":
+        """
+        Concatenate `parts` into one packed GsData that is allocated once, each part is copied into
+        its own rows, so peak memory is the inputs plus a single output.
+
+        :param sh_degrees: SH degree of the result, default the highest of the parts; missing bands
+            are zero, bands above it are dropped
+        :param out_path: build the result in a memory mapped ply at this path (plain 3DGS ply,
+            without colors) instead of in memory
+        """
+        if sh_degrees is None:
+            sh_degrees = max(sh_degree_from_num_rest(3 * part.features_rest.shape[2]) for part in parts)
+        num_rest = 3 * ((sh_degrees + 1) ** 2 - 1)
+        dtype = np.dtype([(name, '<f4') for name in gaussian_property_names(num_rest)])
+        num_columns = len(dtype.names)
+        count = sum(part.xyz.shape[0] for part in parts)
+
+        if out_path is None:
+            merged = cls.empty(count, sh_degrees)
+        else:
+            header = format_ply_header(count, dtype)
+            with open(out_path, "wb") as fid:
+                fid.write(header)
+                fid.truncate(len(header) + count * num_columns * 4)
+            buffer = np.memmap(out_path, dtype='<f4', mode="r+", offset=len(header), shape=(count, num_columns))
+            merged = cls.from_packed(buffer)
+
+        num_coeffs = merged.features_rest.shape[2]
+        start = 0
+        for part in parts:
+            rows = slice(start, start + part.xyz.shape[0])
+            part_buffer = part.packed_buffer()
+            if part_buffer is not None and part_buffer.shape[1] == num_columns:
+                merged.buffer[rows] = part_buffer
+            else:
+                for name in ("xyz", "opacities", "features_dc", "scales", "rotations"):
+                    getattr(merged, name)[rows] = getattr(part, name)
+                k = min(num_coeffs, part.features_rest.shape[2])
+                merged.features_rest[rows, :, :k] = part.features_rest[:, :, :k]
+            start = rows.stop
+
+        if out_path is not None:
+            buffer.flush()
+        return merged
+
+    def load_from_cache(self, cache_dir: str, mmap_mode: str = "c"):
+        header, arrays = gs_cache.load_cache(cache_dir, mmap_mode=mmap_mode)
+        if "buffer" in arrays:
+            self.load_from_packed(arrays["buffer"])
+        else:
+            for name, value in arrays.items():
+                setattr(self, name, value)
+            self.buffer = None
+        self.sh_degrees = header["sh_degrees"]
+
+    def save_to_cache(self, cache_dir: str, source_path: str = None):
+        gs_cache.save_cache(cache_dir, self, source_path=source_path)
+
+    def load_cached(self, ply_file_path: str, cache_dir: str = None):
+        """
+        Load through the native cache next to the ply (`<ply>.cache/` by default), building it on
+        the first call and rebuilding it whenever the ply changed. The result is in the packed layout
+        and cached reloads map the packed buffer straight from disk.
+        """
+        cache_dir = cache_dir or gs_cache.default_cache_dir(ply_file_path)
+        if gs_cache.is_valid(cache_dir, ply_file_path):
+            self.load_from_cache(cache_dir)
+            return
+        self.load_from_ply_packed(ply_file_path)
+        self.save_to_cache(cache_dir, source_path=ply_file_path)
+
+    def spatial_index(self, cache_dir: str = None, cell_size: float = None) -> SpatialIndex:
+        """
+        Voxel grid index over the current xyz for box, sphere and oriented box queries. With
+        `cache_dir` (e.g. the one of `load_cached`) it is saved there and reloaded by later runs for as
+        long as the cache holds the same source ply and xyz has the same bounding box, so call it before
+        transforming xyz: a transformed scene rebuilds (and replaces) the saved index.
+        """
+        if cache_dir is None:
+            return SpatialIndex.build(self.xyz, cell_size)
+        source = (gs_cache.read_header(cache_dir) or {}).get("source") or {}
+        tag = source.get("sha1", "")
+        path = os.path.join(cache_dir, SPATIAL_INDEX_NAME)
+        index = SpatialIndex.load(path, self.xyz, tag)
+        if index is None or (cell_size is not None and index.cell_size != cell_size):
+            index = SpatialIndex.build(self.xyz, cell_size)
+            index.save(path, tag)
+        return index
+
+    def load_from_compressed_ply(self, ply_file_path: str):
+        """
+        Load a compressed ply written by `save_to_compressed_ply` (or SuperSplat / PlayCanvas).
+        """
+        for name, value in read_compressed_ply(ply_file_path).items():
+            setattr(self, name, value)
+        self.sh_degrees = sh_degree_from_num_rest(3 * self.features_rest.shape[2])
+        self.buffer = None
 
-        opacities = self.opacities
-        scale = self.scales
-        rotation = self.rotations
+    def save_to_compressed_ply(self, path: str):
+        """
+        Write the quantized chunked format of `compressed_ply`, ~4x smaller than `save_to_ply` at SH
+        degree 3. The gaussians are stored in Morton order, not in the order of this GsData.
+        """
+        write_compressed_ply(path, self)
 
-        def construct_list_of_attributes():
-            attributes = ['x', 'y', 'z', 'nx', 'ny', 'nz']
-            attributes += [f'f_dc_{i}' for i in range(f_dc.shape[1])]
-            if self.sh_degrees > 0:
-                attributes += [f'f_rest_{i}' for i in range(f_rest.shape[1])]
-            attributes += ["opacity"]
-            attributes += [f'scale_{i}' for i in range(scale.shape[1])]
-            attributes += [f'rot_{i}' for i in range(rotation.shape[1])]
-            return attributes
+    def save_to_splat(self, path: str, sort: bool = True, min_alpha: float = 1 / 255) -> int:
+        """
+        antimatter15 .splat for web viewers, see `splat_formats`. Gaussians with sigmoid(opacity)
+        below `min_alpha` are dropped, `sort` writes them most opaque first.
+        """
+        return splat_formats.write_splat(path, self, sort=sort, min_alpha=min_alpha)
 
-        dtype_full = [(attribute, 'f4') for attribute in construct_list_of_attributes()]
-        attribute_list = [xyz, normals, f_dc, f_rest, opacities, scale, rotation]
+    def save_to_spz(self, path: str, sort: bool = True, min_alpha: float = 1 / 255) -> int:
+        return splat_formats.write_spz(path, self, sort=sort, min_alpha=min_alpha)
+
+    def rescale(self, factor:float):
+        # transforms are in place and keep the attribute dtype, so packed views stay valid
+        self.xyz *= factor
+        # self.scales = self.scales * factor
+        self.scales += np.log(factor)
+
+    def ply_layout(self, with_colors: bool = False):
+        """
+        Row dtype of the saved ply and the (property names, array) groups that fill it,
+        a None array is written as zeros.
+        """
+        n = self.xyz.shape[0]
+        f_dc = self.features_dc.reshape((n, 3))
+
+        if self.sh_degrees > 0:
+            f_rest = self.features_rest.reshape((n, 3 * self.features_rest.shape[2]))
+        else:
+            f_rest = np.zeros((n, 0))
+
+        groups = [
+            (['x', 'y', 'z'], self.xyz),
+            (['nx', 'ny', 'nz'], None),
+            ([f'f_dc_{i}' for i in range(f_dc.shape[1])], f_dc),
+            ([f'f_rest_{i}' for i in range(f_rest.shape[1])], f_rest),
+            (['opacity'], self.opacities),
+            ([f'scale_{i}' for i in range(self.scales.shape[1])], self.scales),
+            ([f'rot_{i}' for i in range(self.rotations.shape[1])], self.rotations),
+        ]
+        dtype_full = [(name, '<f4') for names, _ in groups for name in names]
 
         if with_colors:
-            from sh_utils import eval_sh
-            rgbs = np.clip(eval_sh(0, self.features_dc, None) + 0.5, 0.0, 1.0)
+            # degree 0 color, the DC band only
+            rgbs = np.clip(SH_C0 * f_dc + 0.5, 0.0, 1.0)
             rgbs = (rgbs * 255).astype(np.uint8)
 
             dtype_full += [('red', 'u1'), ('green', 'u1'), ('blue', 'u1')]
-            attribute_list.append(rgbs)
+            groups.append((['red', 'green', 'blue'], rgbs))
+
+        return np.dtype(dtype_full), groups
+
+    def save_to_ply(self, path: str, with_colors: bool = False, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                    sort: bool = False, bounds_chunk_size: int = 0):
+        """
+        :param sort: write the gaussians in Morton order of xyz (63 bit codes, see `morton`), so that
+            consecutive rows are spatially coherent blocks
+        :param bounds_chunk_size: also write the AABB of every run of that many rows to the sidecar
+            `ply_utils.bounds_path(path)`
+        :return: the permutation written when sorted, else None
+        """
+        # os.makedirs(os.path.dirname(path), exist_ok=True)
+        dtype_full, groups = self.ply_layout(with_colors)
+        order = morton_order(self.xyz) if sort else None
+        buffer = self.packed_buffer()
+        if buffer is not None and not with_colors:
+            with open(path, "wb") as fid:
+                fid.write(format_ply_header(self.xyz.shape[0], dtype_full))
+                if order is None:
+                    buffer.tofile(fid)
+                else:
+                    for start in range(0, len(order), chunk_size):
+                        buffer[order[start:start + chunk_size]].tofile(fid)
+        else:
+            write_ply(path, dtype_full, groups, self.xyz.shape[0], chunk_size=chunk_size, order=order)
 
-        elements = np.empty(xyz.shape[0], dtype=dtype_full)
-        attributes = np.concatenate(attribute_list, axis=1)
-        elements[:] = list(map(tuple, attributes))
+        if bounds_chunk_size > 0:
+            save_chunk_bounds(bounds_path(path), self.xyz if order is None else self.xyz[order], bounds_chunk_size)
+        return order
 
-        el = PlyElement.describe(elements, 'vertex')
-        PlyData([el]).write(path)
+    def merge_into_ply(self, scene_ply_path: str, out_path: str, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        """
+        Write the scene ply followed by this GsData's gaussians without decoding the scene: its header
+        is kept with only the vertex count changed, its body is copied byte for byte (see
+        `copy_file_bytes`) and only this GsData's rows are packed, in the scene's row layout.
+
+        The scene must hold a single vertex element with the same properties as `save_to_ply` writes,
+        in any order and types, with or without colors; SH bands are padded or truncated to the scene's.
+        """
+        header = read_ply_header(scene_ply_path)
+        if [element.name for element in header.elements] != ["vertex"]:
+            raise ValueError(f"{scene_ply_path}: expected a single vertex element")
+        element = header.elements[0]
+        dtype = element_dtype(element)
+
+        n = self.xyz.shape[0]
+        rest_names = sorted_property_names(dtype.names, "f_rest_")
+        features_rest = np.zeros((n, 3, len(rest_names) // 3), dtype=np.float32)
+        k = min(features_rest.shape[2], self.features_rest.shape[2])
+        features_rest[:, :, :k] = self.features_rest[:, :, :k]
+
+        _, groups = self.ply_layout(with_colors="red" in dtype.names)
+        groups = [(names, array) for names, array in groups if not any(name.startswith("f_rest_") for name in names)]
+        groups.append((rest_names, features_rest.reshape((n, -1))))
+        if sorted(name for names, _ in groups for name in names) != sorted(dtype.names):
+            raise ValueError(f"{scene_ply_path}: properties {dtype.names} do not match the gaussian layout")
+
+        with open(scene_ply_path, "rb") as src, open(out_path, "wb") as dst:
+            dst.write(replace_vertex_count(src.read(header.size), element.count + n))
+            copy_file_bytes(src, dst, header.size, element.count * dtype.itemsize)
+            for start in range(0, n, chunk_size):
+                pack_rows(dtype, groups, start, min(start + chunk_size, n)).tofile(dst)
     
     
     def rotate(self, rpy: List):
-        rot = R.from_euler('xyz', rpy) 
-        quaternion = rot.as_quat()
-        rot_mat = self.qvec2rotmat(quaternion)
-        
-        # Apply rotation to points
-        self.xyz = (rot_mat @ self.xyz.T).T
-        
-        # Update rotations using quaternion multiplication
-        self.rotations = torch.nn.functional.normalize(
-            torch.from_numpy(self.quat_multiply(self.rotations, quaternion))
-        ).numpy()
-        
-        # Transform SH coefficients
-        features = np.concatenate((self.features_dc, self.features_rest), 
-                                  axis=2).transpose((0, 2, 1))
-        features = self.transform_shs(features, rot_mat)
-        self.features_rest = features[:, 1:, :].transpose((0, 2, 1))
+        self.apply_transform(rotation=rpy)
+
+    def rotation_qvec(self, rotation) -> np.ndarray:
+        """
+        wxyz quaternion of a rotation given as a 3x3 matrix, None (identity) or, for the placements
+        tuned with `rotate`, as the legacy "rpy" of `rpy2qvec`: scipy's xyz Euler quaternion in its
+        xyzw order read as wxyz. That is not the rotation of those Euler angles; for that, pass
+        `R.from_euler('xyz', rpy).as_matrix()`.
+        """
+        if rotation is None:
+            return np.array([1., 0., 0., 0.])
+        if np.shape(rotation) == (3, 3):
+            return self.rotmat2qvec(np.asarray(rotation, dtype=np.float64))
+        return self.rpy2qvec(rotation)
+
+    def apply_transform(self, scale: float = 1.0, rotation=None, translation=(0., 0., 0.),
+                        chunk_size: int = PARALLEL_CHUNK_SIZE, workers: int = None):
+        """
+        Same result as `rescale(scale)`, `rotate(rotation)`, `translation(*translation)` in a single
+        chunked pass: the similarity transform is composed once and xyz, log scales, quaternions and
+        SH are updated in place, chunk by chunk, without full size temporaries.
+
+        :param rotation: 3x3 rotation matrix, or the legacy rpy of `rotate` (not an Euler rotation, see
+            `rotation_qvec`)
+        :param workers: threads the chunks are spread over, see `parallel.run_chunked`; the result
+            is the same for any value
+        """
+        qvec = self.rotation_qvec(rotation)
+        rot_mat = self.qvec2rotmat(qvec)
+
+        # bound once here: deferred attributes are loaded before the threads start, and every thread
+        # writes into the same arrays
+        xyz = self.xyz
+        scales = self.scales if scale != 1.0 else None
+        rotations = self.rotations if rotation is not None else None
+        features_rest = self.features_rest if rotation is not None else None
+
+        linear = (scale * rot_mat).T.astype(xyz.dtype)
+        offset = np.asarray(translation, dtype=xyz.dtype)
+        log_scale = np.log(scale)
+        sh_matrix = None
+        if features_rest is not None and features_rest.shape[2] > 0:
+            sh_matrix = sh_rotation_matrix(rot_mat, sh_degree_from_num_rest(3 * features_rest.shape[2]))
+        if rotations is not None:
+            qvec = qvec.astype(rotations.dtype)
+
+        def transform_chunk(chunk: slice):
+            xyz_chunk = xyz[chunk]
+            xyz_chunk[...] = xyz_chunk @ linear
+            xyz_chunk += offset
+
+            if scales is not None:
+                scales[chunk] += log_scale
+
+            if rotations is not None:
+                rotated = self.quat_multiply(rotations[chunk], qvec)
+                rotations[chunk] = quat_utils.normalize(rotated, out=rotated)
+
+            if sh_matrix is not None:
+                rotate_sh(features_rest[chunk], sh_matrix, chunk_size=chunk_size, workers=1)
+
+        run_chunked(transform_chunk, xyz.shape[0], chunk_size=chunk_size, workers=workers)
+
+    def instance(self, transforms: List, out: "GsData" = None, start: int = 0,
+                 max_rows_per_batch: int = 1 << 20, workers: int = None) -> "GsData":
+        """
+        Write K transformed copies of this GsData in one batched computation per group of instances:
+        one broadcast matmul for xyz, one batched quaternion product and one batched SH matmul with the
+        K Wigner D matrices, instead of K `apply_transform` calls on K copies.
+
+        :param transforms: K (scale, rotation, translation) tuples, as taken by `apply_transform` (a
+            rotation given as rpy follows the legacy convention of `rotation_qvec`)
+        :param out: where the copies go, rows [start, start + K * n), instance by instance; e.g. a merge
+            target from `GsData.empty` that already holds the scene. Default: a new packed GsData.
+        :param max_rows_per_batch: bounds the temporaries, instances are batched up to this many rows
+        :param workers: threads the batches are spread over, each holds the temporaries of one batch
+        """
+        # bound once here, see `apply_transform`
+        xyz, opacities, features_dc = self.xyz, self.opacities, self.features_dc
+        features_rest, scales, rotations = self.features_rest, self.scales, self.rotations
+        n = xyz.shape[0]
+        num_coeffs = features_rest.shape[2]
+        if out is None:
+            out = GsData.empty(len(transforms) * n, self.sh_degrees)
+        out_xyz, out_opacities, out_features_dc = out.xyz, out.opacities, out.features_dc
+        out_features_rest, out_scales, out_rotations = out.features_rest, out.scales, out.rotations
+        if out_features_rest.shape[2] != num_coeffs:
+            raise ValueError(f"output has {out_features_rest.shape[2]} SH coefficients per channel, source {num_coeffs}")
+
+        factors = np.array([float(scale) for scale, _, _ in transforms])
+        qvecs = np.stack([self.rotation_qvec(rotation) for _, rotation, _ in transforms])
+        rot_mats = quat_utils.qvec2rotmat(qvecs)
+        translations = np.array([translation for _, _, translation in transforms], dtype=np.float64)
+        if num_coeffs > 0:
+            sh_matrices = sh_rotation_matrix(rot_mats, sh_degree_from_num_rest(3 * num_coeffs))
+            sh_matrices = sh_matrices.transpose((0, 2, 1)).astype(out_features_rest.dtype)
+
+        def repeat(value, k):
+            return np.broadcast_to(value, (k,) + value.shape).reshape((k * n,) + value.shape[1:])
+
+        dtype = out_xyz.dtype
+        per_batch = max(1, max_rows_per_batch // max(n, 1))
+
+        def instance_batch(batch: slice):
+            k = batch.stop - batch.start
+            rows = slice(start + batch.start * n, start + batch.stop * n)
+
+            # [n, 3] @ [k, 3, 3] -> [k, n, 3]
+            linear = (factors[batch, None, None] * rot_mats[batch]).transpose((0, 2, 1)).astype(dtype)
+            out_xyz[rows] = (xyz @ linear + translations[batch, None, :].astype(dtype)).reshape((-1, 3))
+            out_scales[rows] = (scales + np.log(factors[batch])[:, None, None]).reshape((-1, 3))
+
+            rotated = self.quat_multiply(rotations, qvecs[batch, None, :].astype(out_rotations.dtype))
+            out_rotations[rows] = quat_utils.normalize(rotated, out=rotated).reshape((-1, 4))
+
+            out_opacities[rows] = repeat(opacities, k)
+            out_features_dc[rows] = repeat(features_dc, k)
+            if num_coeffs > 0:
+                # [n * 3, K] @ [k, K, K] -> [k, n * 3, K]
+                rest = features_rest.reshape((n * 3, num_coeffs)) @ sh_matrices[batch]
+                out_features_rest[rows] = rest.reshape((k * n, 3, num_coeffs))
+
+        run_chunked(instance_batch, len(transforms), chunk_size=per_batch, workers=workers)
+        return out
 
     def translation(self, x: float, y: float, z: float):
         if x == 0. and y == 0. and z == 0.:
             return
         # Apply translation after rotation
-        self.xyz = self.xyz + np.array([x, y, z])
+        self.xyz += np.array([x, y, z], dtype=self.xyz.dtype)
     
     def deg2rad(self, rpy_deg):
         return [(np.pi/180)  * i  for i in rpy_deg]
 
+    @classmethod
+    def load_many(cls, ply_file_paths: List[str], loader: str = "load_from_ply_packed", max_workers: int = None):
+        """
+        Load several plys concurrently on a thread pool. The loaders spend their time in file reads
+        and numpy copies, which release the GIL, so this scales with cores and disks.
+
+        :param loader: name of the GsData load method to use, e.g. "load_cached"
+        :return: (GsData list in the order of `ply_file_paths`, per file timing dicts with the
+            seconds spent queued and loading)
+        """
+        def load(path, submitted):
+            started = time.perf_counter()
+            gs = cls()
+            getattr(gs, loader)(path)
+            finished = time.perf_counter()
+            megabytes = os.path.getsize(path) / 2**20
+            return gs, {"path": path, "count": gs.xyz.shape[0], "megabytes": megabytes,
+                        "queued": started - submitted, "load": finished - started,
+                        "throughput": megabytes / max(finished - started, 1e-9)}
+
+        max_workers = max_workers or min(len(ply_file_paths), os.cpu_count() or 1)
+        with ThreadPoolExecutor(max_workers=max(max_workers, 1)) as pool:
+            submitted = time.perf_counter()
+            results = list(pool.map(load, ply_file_paths, [submitted] * len(ply_file_paths)))
+        return [gs for gs, _ in results], [timing for _, timing in results]
+
+    @classmethod
+    def iter_ply_chunks(cls, ply_file_path: str, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        """
+        Yield a ply file as GsData chunks of at most `chunk_size` gaussians.
+        """
+        for vertex in iter_vertex_chunks(ply_file_path, chunk_size):
+            chunk = cls()
+            chunk.load_from_vertices(vertex)
+            yield chunk
+
+    @classmethod
+    def stream_transform_ply(cls, in_path: str, out_path: str, ops: List, with_colors: bool = False,
+                             chunk_size: int = DEFAULT_CHUNK_SIZE):
+        """
+        Out-of-core version of load -> transform -> save for scenes larger than RAM. Peak memory is
+        bounded by `chunk_size`, not by the scene size.
+
+        :param ops: GsData method calls applied in order to every chunk, e.g.
+            [("rescale", (0.06,)), ("rotate", (rpy_rad,)), ("translation", (x, y, z))]
+        :return: number of gaussians written
+        """
+        writer = None
+        try:
+            for chunk in cls.iter_ply_chunks(in_path, chunk_size):
+                for name, args in ops:
+                    getattr(chunk, name)(*args)
+
+                dtype_full, groups = chunk.ply_layout(with_colors)
+                if writer is None:
+                    writer = StreamingPlyWriter(out_path, dtype_full)
+                writer.write(pack_rows(dtype_full, groups, 0, chunk.xyz.shape[0]))
+        finally:
+            if writer is not None:
+                writer.close()
+        return 0 if writer is None else writer.count
+
 if __name__ == "__main__":
     base_obj_fdr = "data"
     base_scene_fdr = "data"
     
-    # Load and process the object PLY file
+    # Load the object and the scene PLY files concurrently
     obj_path = os.path.join(base_obj_fdr, "point_cloud.ply")
-    obj_gs_data = GsData()
-    obj_gs_data.load_from_ply(obj_path)
+    scene_path = os.path.join(base_scene_fdr, "iteration_6999_clean.ply")
+    (obj_gs_data, scene_gs_data), timings = GsData.load_many([obj_path, scene_path], loader="load_cached")
+    for timing in timings:
+        print(f"Loaded {timing['path']}: {timing['count']} gaussians in {timing['load']:.2f} s")
 
     # Process object (scale and rotate)
     scale_factor = 0.06
@@ -266,30 +737,22 @@ if __name__ == "__main__":
     x, y, z = 0.05, -0.3, 0.6 # z val -> high bring up obj # inc in y -> toward the center
     obj_gs_data.translation(x,y,z)
 
-    # Load the scene PLY file
-    scene_path = os.path.join(base_scene_fdr, "iteration_6999_clean.ply")  
-    scene_gs_data = GsData()
-    scene_gs_data.load_from_ply(scene_path)
-
-
     
+    # remove the scene gaussians inside the placed object, e.g. grass poking through the canvas
+    carve_scene = False
+    if carve_scene:
+        scene_gs_data, carved = scene_gs_data.carve(obj_gs_data)
+        print(f"Carved {carved.sum()} scene gaussians inside the object")
+
     # Merge the data
-    # Concatenate all attributes
-    merged_gs = GsData()
-    # xyz = (1000000, 3) + (123196, 3) = (1123196, 3)
-    merged_gs.xyz = np.concatenate([scene_gs_data.xyz, obj_gs_data.xyz], axis=0) 
-    # opacities = (1000000, 1) + (123196, 1) = (1123196, 1)
-    merged_gs.opacities = np.concatenate([scene_gs_data.opacities, obj_gs_data.opacities], axis=0) 
-    
-    #  features_dc = (1000000, 3, 1) + (123196, 3, 1) = (1123196, 3, 1)
-    merged_gs.features_dc = np.concatenate([scene_gs_data.features_dc, obj_gs_data.features_dc], axis=0)
-    #  features_rest = (1000000, 3, 15) + (123196, 3, 15) = (1123196, 3, 15)
-    merged_gs.features_rest = np.concatenate([scene_gs_data.features_rest, obj_gs_data.features_rest], axis=0)
-    #  scales = (1000000, 3) + (123196, 3) = (1123196, 3)
-    merged_gs.scales = np.concatenate([scene_gs_data.scales, obj_gs_data.scales], axis=0)
-    #  rotations -> (1000000, 4) + (123196, 4) = (1123196, 4)
-    merged_gs.rotations = np.concatenate([scene_gs_data.rotations, obj_gs_data.rotations], axis=0)
-    merged_gs.sh_degrees = scene_gs_data.sh_degrees  # Assuming both have same SH degrees
+    # One preallocated (1000000 + 123196, 62) buffer, each input copied into its rows
+    merged_gs = GsData.merge([scene_gs_data, obj_gs_data])
+
+    # drop object gaussians duplicating scene gaussians on the seam (and vice versa)
+    dedup_seam = False
+    if dedup_seam:
+        merged_gs, dropped = merged_gs.deduplicate(radius=1e-3, split=len(scene_gs_data.xyz))
+        print(f"Dropped {dropped.sum()} duplicate gaussians on the seam")
 
 
     # Save the merged result
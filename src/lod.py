@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Offline level of detail for splats.
+
+    $ python lod.py garden_canvas_merged.ply garden_lod.ply --levels 4
+
+The gaussians are Morton sorted once, so every octree cell at every depth is a contiguous run of
+rows and a level is a set of `np.add.reduceat` over those runs. Each coarser level keeps the
+deepest octree depth that reduces the count by at least `ratio`, and every cell becomes one
+gaussian, built from the original gaussians of the cell with weights w = alpha * volume:
+
+    mean        sum(w x) / sum(w)
+    covariance  sum(w (cov + x x^T)) / sum(w) - mean mean^T     (moment matching)
+    opacity     1 - prod(1 - alpha)
+    SH          sum(w sh) / sum(w)
+
+All levels go in one ply, finest first, with the row offsets in a `lod_offsets` header comment.
+"""
+import argparse
+import time
+
+import numpy as np
+
+import quat_utils
+from gs_utils import sigmoid
+from morton import MORTON_BITS, morton_codes
+from ply_utils import format_ply_header, gaussian_property_names, read_ply_header
+
+LOD_COMMENT = "lod_offsets"
+# 3x3 symmetric matrices as 6 values
+_UPPER = (np.array([0, 0, 0, 1, 1, 2]), np.array([0, 1, 2, 1, 2, 2]))
+_MAX_ALPHA = 1.0 - 1e-6
+
+
+def level_depths(sorted_codes: np.ndarray, num_levels: int, ratio: float = 8.0):
+    """
+    :return: octree depth of each coarse level, the deepest one with at most count / ratio cells
+        (count of the previous level)
+    """
+    depths = []
+    count = len(sorted_codes)
+    depth = MORTON_BITS
+    for _ in range(num_levels - 1):
+        while depth > 0:
+            keys = sorted_codes >> np.uint64(3 * (MORTON_BITS - depth))
+            cells = 1 + np.count_nonzero(keys[1:] != keys[:-1])
+            if cells <= count / ratio:
+                break
+            depth -= 1
+        if cells > count / ratio:
+            break
+        depths.append(depth)
+        count = cells
+    return depths
+
+
+def _cell_moments(gs, rows: np.ndarray, starts: np.ndarray, center: np.ndarray):
+    """
+    Per cell sums of the gaussians `rows` (cells start at `starts`, relative to `rows`).
+    """
+    xyz = gs.xyz[rows].astype(np.float64) - center
+    alpha = np.minimum(sigmoid(gs.opacities[rows, 0].astype(np.float64)), _MAX_ALPHA)
+    log_scales = gs.scales[rows].astype(np.float64)
+    log_volume = log_scales.sum(axis=1)
+    weights = np.maximum(alpha * np.exp(log_volume - log_volume.max()), 1e-300)
+
+    # cov = R diag(s^2) R^T
+    rot_mats = quat_utils.qvec2rotmat(quat_utils.normalize(gs.rotations[rows].astype(np.float64)))
+    rs = rot_mats * np.exp(log_scales)[:, None, :]
+    second = rs @ rs.transpose((0, 2, 1)) + xyz[:, :, None] * xyz[:, None, :]
+
+    sums = {
+        "weight": np.add.reduceat(weights, starts),
+        "xyz": np.add.reduceat(weights[:, None] * xyz, starts),
+        "second": np.add.reduceat(weights[:, None] * second[:, _UPPER[0], _UPPER[1]], starts),
+        "log_transmittance": np.add.reduceat(np.log1p(-alpha), starts),
+        "features_dc": np.add.reduceat(weights[:, None] * gs.features_dc[rows].reshape((len(rows), -1)), starts),
+    }
+    if gs.features_rest.shape[2] > 0:
+        rest = gs.features_rest[rows].reshape((len(rows), -1))
+        sums["features_rest"] = np.add.reduceat(weights[:, None] * rest, starts)
+    return sums
+
+
+def build_level(gs, order: np.ndarray, cell_starts: np.ndarray, center: np.ndarray = None,
+                chunk_size: int = 1 << 18):
+    """
+    One gaussian per cell: cell c holds the gaussians `order[cell_starts[c]:cell_starts[c + 1]]`.
+
+    :return: packed GsData with one row per cell, in cell order
+    """
+    num_cells = len(cell_starts) - 1
+    level = type(gs).empty(num_cells, gs.sh_degrees)
+    center = gs.xyz.mean(axis=0, dtype=np.float64) if center is None else center
+
+    first = 0
+    while first < num_cells:
+        # as many whole cells as fit in chunk_size rows, at least one
+        last = max(first + 1, np.searchsorted(cell_starts, cell_starts[first] + chunk_size, side="right") - 1)
+        last = min(last, num_cells)
+        rows = order[cell_starts[first]:cell_starts[last]]
+        sums = _cell_moments(gs, rows, cell_starts[first:last] - cell_starts[first], center)
+        cells = slice(first, last)
+
+        weight = sums["weight"][:, None]
+        mean = sums["xyz"] / weight
+        cov = np.empty((last - first, 3, 3))
+        cov[:, _UPPER[0], _UPPER[1]] = sums["second"] / weight
+        cov[:, _UPPER[1], _UPPER[0]] = cov[:, _UPPER[0], _UPPER[1]]
+        cov -= mean[:, :, None] * mean[:, None, :]
+
+        eigvals, eigvecs = np.linalg.eigh(cov)
+        # proper rotations only
+        eigvecs[:, :, 2] *= np.sign(np.linalg.det(eigvecs))[:, None]
+        level.xyz[cells] = mean + center
+        level.scales[cells] = 0.5 * np.log(np.maximum(eigvals, 1e-20))
+        level.rotations[cells] = quat_utils.rotmat2qvec(eigvecs)
+
+        alpha = np.clip(-np.expm1(sums["log_transmittance"]), 1e-6, _MAX_ALPHA)
+        level.opacities[cells, 0] = np.log(alpha / (1.0 - alpha))
+        level.features_dc[cells] = (sums["features_dc"] / weight).reshape((-1, 3, 1))
+        if "features_rest" in sums:
+            level.features_rest[cells] = (sums["features_rest"] / weight).reshape((last - first, 3, -1))
+        first = last
+    return level
+
+
+def build_lod(gs, num_levels: int = 4, ratio: float = 8.0):
+    """
+    :return: list of GsData, the input first, then coarser and coarser levels
+    """
+    codes = morton_codes(gs.xyz)
+    order = np.argsort(codes, kind="stable")
+    codes = codes[order]
+    center = gs.xyz.mean(axis=0, dtype=np.float64)
+
+    levels = [gs]
+    for depth in level_depths(codes, num_levels, ratio):
+        keys = codes >> np.uint64(3 * (MORTON_BITS - depth))
+        cell_starts = np.append(np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]), len(keys))
+        levels.append(build_level(gs, order, cell_starts, center))
+    return levels
+
+
+def save_lod_ply(path: str, levels):
+    """
+    All levels in one plain 3DGS ply, finest first; viewers see one big splat, LOD aware readers take
+    the levels from `read_lod_offsets`.
+    """
+    from insert_canvas_in_garden import GsData
+
+    num_rest = 3 * max(level.features_rest.shape[2] for level in levels)
+    dtype = np.dtype([(name, '<f4') for name in gaussian_property_names(num_rest)])
+    offsets = np.cumsum([0] + [len(level.xyz) for level in levels])
+    merged = GsData.merge(levels)
+    with open(path, "wb") as fid:
+        fid.write(format_ply_header(int(offsets[-1]), dtype,
+                                    comments=[f"{LOD_COMMENT} " + " ".join(map(str, offsets))]))
+        merged.buffer.tofile(fid)
+    return offsets
+
+
+def read_lod_offsets(path: str):
+    """
+    :return: row offsets of the levels, level i is rows [offsets[i], offsets[i + 1]), or None
+    """
+    for comment in read_ply_header(path).comments:
+        if comment.startswith(LOD_COMMENT + " "):
+            return np.array([int(value) for value in comment.split()[1:]])
+    return None
+
+
+def main():
+    from insert_canvas_in_garden import GsData
+
+    parser = argparse.ArgumentParser(description="Build LOD levels of a 3DGS ply into one file")
+    parser.add_argument("input")
+    parser.add_argument("output")
+    parser.add_argument("--levels", type=int, default=4, help="number of levels, the input included")
+    parser.add_argument("--ratio", type=float, default=8.0, help="minimum count reduction per level")
+    args = parser.parse_args()
+
+    gs = GsData()
+    gs.load_from_ply_packed(args.input)
+    t0 = time.perf_counter()
+    levels = build_lod(gs, args.levels, args.ratio)
+    print(f"Built {[len(level.xyz) for level in levels]} gaussians per level in {time.perf_counter() - t0:.2f} s")
+    save_lod_ply(args.output, levels)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+import numpy as np
+
+MORTON_BITS = 21  # bits per axis, 3 * 21 = 63 bit codes
+
+
+def _part1by2(v: np.ndarray) -> np.ndarray:
+    """
+    Spread the low 21 bits of every value so that there are two zero bits between each of them.
+    """
+    v = v.astype(np.uint64) & 0x1fffff
+    v = (v | (v << 32)) & 0x1f00000000ffff
+    v = (v | (v << 16)) & 0x1f0000ff0000ff
+    v = (v | (v << 8)) & 0x100f00f00f00f00f
+    v = (v | (v << 4)) & 0x10c30c30c30c30c3
+    v = (v | (v << 2)) & 0x1249249249249249
+    return v
+
+
+def quantize(xyz: np.ndarray, bits: int = MORTON_BITS, bounds=None) -> np.ndarray:
+    """
+    Map points onto a [0, 2^bits) integer grid spanning `bounds` (default: their own AABB).
+
+    :return: uint64 [n, 3]
+    """
+    if len(xyz) == 0:
+        return np.zeros((0, 3), dtype=np.uint64)
+    lo, hi = (xyz.min(axis=0), xyz.max(axis=0)) if bounds is None else bounds
+    extent = np.where(hi > lo, hi - lo, 1.0).astype(np.float64)
+    top = (1 << bits) - 1
+    return np.clip((xyz - lo) / extent * top, 0, top).astype(np.uint64)
+
+
+def morton_encode(cells: np.ndarray) -> np.ndarray:
+    """
+    Interleave integer cell coordinates [n, 3] (each < 2^21) into uint64 Morton codes.
+    """
+    return _part1by2(cells[:, 0]) | (_part1by2(cells[:, 1]) << 1) | (_part1by2(cells[:, 2]) << 2)
+
+
+def morton_codes(xyz: np.ndarray, bits: int = MORTON_BITS, bounds=None) -> np.ndarray:
+    return morton_encode(quantize(xyz, bits, bounds))
+
+
+def morton_order(xyz: np.ndarray) -> np.ndarray:
+    """
+    Permutation that sorts points along the Z-order curve of their bounding box.
+    """
+    return np.argsort(morton_codes(xyz), kind="stable")
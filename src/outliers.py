@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Statistical outlier removal for gaussians and COLMAP points, k nearest neighbors based.
+
+    $ python outliers.py iteration_6999.ply iteration_6999_clean.ply --k 20 --std-ratio 2.0
+
+Every point gets the mean distance to its k nearest neighbors; points whose distance is above
+mean + std_ratio * std over all points are dropped. The KD-tree is built once and queried in
+chunks on a thread pool (the queries release the GIL), so memory stays at the tree plus one
+[chunk, k] distance block per worker.
+"""
+import argparse
+import time
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from morton import morton_order
+from parallel import PARALLEL_CHUNK_SIZE, run_chunked
+
+DEFAULT_K = 20
+DEFAULT_STD_RATIO = 2.0
+
+
+def mean_neighbor_distances(xyz: np.ndarray, k: int = DEFAULT_K, workers: int = None,
+                            chunk_size: int = PARALLEL_CHUNK_SIZE) -> np.ndarray:
+    """
+    :return: [n] mean distance of every point to its `k` nearest neighbors, itself excluded
+    """
+    k = min(k, len(xyz) - 1)
+    distances = np.zeros(len(xyz), dtype=np.float64)
+    if k < 1:
+        return distances
+    # Morton order: consecutive queries walk the same tree nodes, about twice as fast as file order
+    order = morton_order(xyz)
+    xyz = np.ascontiguousarray(xyz[order], dtype=np.float64)
+    tree = cKDTree(xyz, balanced_tree=False, compact_nodes=False)
+
+    def query_chunk(rows: slice):
+        # the nearest neighbor of a point is itself, at distance 0
+        neighbor_distances, _ = tree.query(xyz[rows], k=k + 1)
+        distances[order[rows]] = neighbor_distances[:, 1:].mean(axis=1)
+
+    run_chunked(query_chunk, len(xyz), chunk_size=chunk_size, workers=workers)
+    return distances
+
+
+def statistical_inliers(xyz: np.ndarray, k: int = DEFAULT_K, std_ratio: float = DEFAULT_STD_RATIO,
+                        weights: np.ndarray = None, workers: int = None) -> np.ndarray:
+    """
+    :param weights: optional [n] confidences in (0, 1], e.g. gaussian opacities after the sigmoid; the
+        mean neighbor distance is divided by them, so faint isolated points go first
+    :return: [n] boolean mask, True for the points to keep
+    """
+    scores = mean_neighbor_distances(xyz, k, workers=workers)
+    if weights is not None:
+        scores /= np.maximum(np.asarray(weights, dtype=np.float64).reshape(-1), 1e-6)
+    return scores <= scores.mean() + std_ratio * scores.std()
+
+
+def filter_points3D(points3D: dict, k: int = DEFAULT_K, std_ratio: float = DEFAULT_STD_RATIO,
+                    workers: int = None) -> dict:
+    """
+    Same filter on the `points3D` of `read_write_model.read_model`.
+
+    :return: the kept {point3D_id: Point3D}
+    """
+    ids = list(points3D)
+    xyz = np.array([points3D[point_id].xyz for point_id in ids], dtype=np.float64).reshape((-1, 3))
+    keep = statistical_inliers(xyz, k, std_ratio, workers=workers)
+    return {point_id: points3D[point_id] for point_id, kept in zip(ids, keep) if kept}
+
+
+def main():
+    from insert_canvas_in_garden import GsData
+
+    parser = argparse.ArgumentParser(description="KNN statistical outlier removal on a 3DGS ply")
+    parser.add_argument("input")
+    parser.add_argument("output")
+    parser.add_argument("--k", type=int, default=DEFAULT_K, help="number of neighbors")
+    parser.add_argument("--std-ratio", type=float, default=DEFAULT_STD_RATIO,
+                        help="drop above mean + std_ratio * std of the mean neighbor distance")
+    parser.add_argument("--opacity-weighted", action="store_true",
+                        help="divide the distances by the opacities, faint floaters go first")
+    parser.add_argument("--workers", type=int, default=None, help="query threads, default all cores")
+    args = parser.parse_args()
+
+    gs = GsData()
+    gs.load_from_ply_packed(args.input)
+    t0 = time.perf_counter()
+    kept = gs.remove_outliers(args.k, args.std_ratio, args.opacity_weighted, workers=args.workers)
+    print(f"Kept {len(kept.xyz)} of {len(gs.xyz)} gaussians in {time.perf_counter() - t0:.2f} s")
+    kept.save_to_ply(args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""
+Interactive object placement.
+
+    session = PlacementSession(scene_gs_data, obj_gs_data)
+    # rotation: the legacy rpy of GsData.rotate, as in insert_canvas_in_garden.py, or a 3x3 matrix
+    session.set_pose(scale=0.06, rotation=obj_gs_data.deg2rad([80, -180, 30]), translation=(0.05, -0.3, 0.6))
+    session.set_pose(translation=(0.05, -0.25, 0.6))  # only xyz of the object is rewritten
+    session.place_on_support((0.05, -0.3), radius=0.1)  # stand it on the ground below that xy instead
+    session.save("data/garden_canvas_merged.ply")
+"""
+import collections
+
+import numpy as np
+
+import quat_utils
+from ply_utils import sh_degree_from_num_rest
+from sh_rotation import rotate_sh, sh_rotation_matrix
+
+RotatedObject = collections.namedtuple("RotatedObject", ["xyz", "rotations", "features_rest"])
+SupportPose = collections.namedtuple("SupportPose", ["translation", "rotation", "normal", "inlier_ratio"])
+
+
+class PlacementSession:
+    """
+    Keeps the scene and the untransformed object in memory, together with the merged result.
+
+    A pose change only recomputes what it affects: a new rotation rotates xyz, quaternions and SH
+    (or takes them from a small LRU of recent rotations), while a scale or translation change is a
+    delta on the object's xyz and log scales only.
+    """
+
+    def __init__(self, scene, obj, cache_size: int = 8):
+        if scene.features_rest.shape[2] != obj.features_rest.shape[2]:
+            raise ValueError("scene and object must have the same SH degree, see GsData.merge")
+        self.obj = obj
+        self.cache_size = cache_size
+        self._rotated = collections.OrderedDict()
+
+        num_scene = scene.xyz.shape[0]
+        self.merged = type(obj).empty(num_scene + obj.xyz.shape[0], obj.sh_degrees)
+        for name in type(obj).ATTRIBUTES:
+            getattr(self.merged, name)[:num_scene] = getattr(scene, name)
+        self.object_rows = slice(num_scene, None)
+        self.merged.opacities[self.object_rows] = obj.opacities
+        self.merged.features_dc[self.object_rows] = obj.features_dc
+
+        self.scale = None
+        self.qvec = None
+        self.translation = None
+
+    def rotated(self, qvec: np.ndarray) -> RotatedObject:
+        """
+        Object xyz, quaternions and SH rotated by `qvec`, memoized per rotation.
+        """
+        key = tuple(np.round(qvec, 12))
+        if key in self._rotated:
+            self._rotated.move_to_end(key)
+            return self._rotated[key]
+
+        obj = self.obj
+        rot_mat = obj.qvec2rotmat(qvec)
+        rotations = obj.quat_multiply(obj.rotations, qvec.astype(obj.rotations.dtype))
+        quat_utils.normalize(rotations, out=rotations)
+        features_rest = np.array(obj.features_rest)
+        if features_rest.shape[2] > 0:
+            rotate_sh(features_rest, sh_rotation_matrix(rot_mat, sh_degree_from_num_rest(3 * features_rest.shape[2])))
+        rotated = RotatedObject(obj.xyz @ rot_mat.T.astype(obj.xyz.dtype), rotations, features_rest)
+
+        self._rotated[key] = rotated
+        while len(self._rotated) > self.cache_size:
+            self._rotated.popitem(last=False)
+        return rotated
+
+    def set_pose(self, scale: float = None, rotation=None, translation=None):
+        """
+        Update the object pose in the merged GsData, arguments left to None keep their current value.
+
+        :param rotation: 3x3 matrix, or the legacy rpy of `GsData.rotate` (not an Euler rotation, see
+            `GsData.rotation_qvec`), as taken by `GsData.apply_transform`
+        :return: the parts that were recomputed, e.g. ["xyz", "scales"]
+        """
+        scale = self.scale if scale is None else float(scale)
+        scale = 1.0 if scale is None else scale
+        qvec = self.qvec if rotation is None else self.obj.rotation_qvec(rotation)
+        qvec = self.obj.rotation_qvec(None) if qvec is None else qvec
+        translation = self.translation if translation is None else np.asarray(translation, dtype=np.float64)
+        translation = np.zeros(3) if translation is None else translation
+
+        updated = []
+        rotation_changed = self.qvec is None or not np.array_equal(qvec, self.qvec)
+        rows = self.object_rows
+        rotated = self.rotated(qvec)
+        if rotation_changed:
+            self.merged.rotations[rows] = rotated.rotations
+            self.merged.features_rest[rows] = rotated.features_rest
+            updated += ["rotations", "features_rest"]
+        if scale != self.scale:
+            self.merged.scales[rows] = self.obj.scales + np.log(scale)
+            updated.append("scales")
+        if rotation_changed or scale != self.scale or not np.array_equal(translation, self.translation):
+            xyz = self.merged.xyz[rows]
+            np.multiply(rotated.xyz, scale, out=xyz, casting="same_kind")
+            xyz += translation.astype(xyz.dtype)
+            updated.append("xyz")
+
+        self.scale, self.qvec, self.translation = scale, qvec, translation
+        return updated
+
+    def place_on_support(self, xy, scale: float = None, rotation=None, **support_kwargs) -> SupportPose:
+        """
+        Stand the object on the scene surface below `xy`, see `support_pose`: the object is scaled
+        and rotated as in `set_pose` (arguments left to None keep their current value, `rotation`
+        follows the same conventions), then tilted onto the surface and lifted so that it rests on it.
+        """
+        scale = self.scale if scale is None else float(scale)
+        scale = 1.0 if scale is None else scale
+        qvec = self.qvec if rotation is None else self.obj.rotation_qvec(rotation)
+        qvec = self.obj.rotation_qvec(None) if qvec is None else qvec
+
+        scene_xyz = self.merged.xyz[:self.object_rows.start]
+        pose = support_pose(scene_xyz, xy, obj_xyz=self.rotated(qvec).xyz * scale, **support_kwargs)
+        self.set_pose(scale=scale, rotation=pose.rotation @ self.obj.qvec2rotmat(qvec),
+                      translation=pose.translation)
+        return pose
+
+    def save(self, path: str, with_colors: bool = False):
+        self.merged.save_to_ply(path, with_colors=with_colors)
+
+
+def fit_plane_ransac(points: np.ndarray, threshold: float, iterations: int = 256, max_points: int = 4096,
+                     seed: int = 0):
+    """
+    Vectorized RANSAC: `iterations` random triples of a random sample of at most `max_points` points
+    are turned into planes at once and scored against the whole sample in one [iterations, sample]
+    distance matrix, the best plane is then refined by least squares on its inliers.
+
+    :return: (unit normal [3], offset d of the plane normal . x + d = 0, inlier ratio in the sample)
+    """
+    if len(points) < 3:
+        raise ValueError(f"need at least 3 points to fit a plane, got {len(points)}")
+    rng = np.random.default_rng(seed)
+    points = np.asarray(points, dtype=np.float64)
+    sample = points[rng.choice(len(points), min(max_points, len(points)), replace=False)]
+
+    triples = sample[rng.integers(0, len(sample), size=(iterations, 3))]
+    normals = np.cross(triples[:, 1] - triples[:, 0], triples[:, 2] - triples[:, 0])
+    norms = np.linalg.norm(normals, axis=1)
+    valid = norms > 1e-12
+    normals = normals[valid] / norms[valid, None]
+    if len(normals) == 0:
+        raise ValueError("points are degenerate, no plane could be fitted")
+    offsets = -np.sum(normals * triples[valid, 0], axis=1)
+
+    inliers = np.abs(normals @ sample.T + offsets[:, None]) < threshold
+    best = np.argmax(inliers.sum(axis=1))
+    plane_points = sample[inliers[best]]
+
+    # least squares refinement: the normal is the direction of least variance of the inliers
+    centroid = plane_points.mean(axis=0)
+    normal = np.linalg.svd(plane_points - centroid, full_matrices=False)[2][-1]
+    return normal, -normal @ centroid, float(inliers[best].mean())
+
+
+def rotation_between(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    Smallest rotation matrix taking the unit vector `a` onto the unit vector `b`.
+    """
+    axis = np.cross(a, b)
+    sin, cos = np.linalg.norm(axis), float(np.dot(a, b))
+    if sin < 1e-12:
+        if cos > 0:
+            return np.eye(3)
+        # opposite vectors: half turn about any axis orthogonal to a
+        ortho = np.cross(a, [1.0, 0.0, 0.0] if abs(a[0]) < 0.9 else [0.0, 1.0, 0.0])
+        ortho /= np.linalg.norm(ortho)
+        return 2.0 * np.outer(ortho, ortho) - np.eye(3)
+    k = np.array([[0, -axis[2], axis[1]], [axis[2], 0, -axis[0]], [-axis[1], axis[0], 0]]) / sin
+    return np.eye(3) + sin * k + (1.0 - cos) * (k @ k)
+
+
+def support_pose(scene_xyz: np.ndarray, xy, radius: float = 0.1, obj_xyz: np.ndarray = None,
+                 up=(0.0, 0.0, 1.0), max_height: float = None, threshold: float = None,
+                 index=None, **ransac_kwargs) -> SupportPose:
+    """
+    Find the surface supporting an object dropped at `xy` (scene coordinates, z up by default).
+
+    The scene gaussians in the vertical column of `radius` around `xy` (below `max_height` if given)
+    are fitted with `fit_plane_ransac`. The returned rotation takes `up` onto the plane normal, and the
+    translation puts the object origin on the plane at `xy`, lifted so that the lowest point of
+    `obj_xyz` (already posed and scaled, but not aligned) touches the plane.
+
+    :param threshold: RANSAC inlier distance, default 5% of `radius`
+    :param index: optional `spatial_index.SpatialIndex` over `scene_xyz` for the column query
+    """
+    up = np.asarray(up, dtype=np.float64) / np.linalg.norm(up)
+    x, y = float(xy[0]), float(xy[1])
+    # the column as a box, then the exact radius test in the plane orthogonal to up (z up: xy)
+    lo, hi = scene_xyz.min(axis=0), scene_xyz.max(axis=0)
+    lo = np.array([x - radius, y - radius, lo[2]])
+    hi = np.array([x + radius, y + radius, hi[2] if max_height is None else max_height])
+    if index is not None:
+        candidates = index.query_aabb(lo, hi)
+    else:
+        candidates = np.flatnonzero(np.all((scene_xyz >= lo) & (scene_xyz <= hi), axis=1))
+    column = scene_xyz[candidates].astype(np.float64)
+    column = column[np.sum((column[:, :2] - [x, y]) ** 2, axis=1) <= radius * radius]
+
+    normal, offset, inlier_ratio = fit_plane_ransac(column, threshold or 0.05 * radius, **ransac_kwargs)
+    if normal @ up < 0:
+        normal, offset = -normal, -offset
+    if abs(normal[2]) < 1e-6:
+        raise ValueError(f"the surface at {xy} is vertical")
+
+    rotation = rotation_between(up, normal)
+    # plane point above/below xy: normal . (x, y, z) + offset = 0
+    translation = np.array([x, y, -(normal[0] * x + normal[1] * y + offset) / normal[2]])
+    if obj_xyz is not None and len(obj_xyz) > 0:
+        translation -= normal * np.min(obj_xyz.astype(np.float64) @ rotation.T @ normal)
+    return SupportPose(translation, rotation, normal, inlier_ratio)
@@ -0,0 +1,307 @@
+import collections
+import os
+import re
+from typing import List
+
+import numpy as np
+from numpy.lib import recfunctions as rfn
+
+PlyProperty = collections.namedtuple("PlyProperty", ["name", "type"])
+PlyElementHeader = collections.namedtuple("PlyElementHeader", ["name", "count", "properties"])
+PlyHeader = collections.namedtuple("PlyHeader", ["format", "elements", "comments", "size"])
+
+# ply scalar type name -> numpy type code (little endian is added by `element_dtype`)
+PLY_TYPES = {
+    "char": "i1", "int8": "i1",
+    "uchar": "u1", "uint8": "u1",
+    "short": "i2", "int16": "i2",
+    "ushort": "u2", "uint16": "u2",
+    "int": "i4", "int32": "i4",
+    "uint": "u4", "uint32": "u4",
+    "float": "f4", "float32": "f4",
+    "double": "f8", "float64": "f8",
+}
+# numpy type code -> ply scalar type name, using the names plyfile writes
+NUMPY_TO_PLY = {"i1": "char", "u1": "uchar", "i2": "short", "u2": "ushort",
+                "i4": "int", "u4": "uint", "f4": "float", "f8": "double"}
+
+
+def read_ply_header(path: str) -> PlyHeader:
+    """
+    Parse the header of a binary little endian ply file without touching its body.
+
+    :param path: ply file path
+    :return: PlyHeader, `size` is the byte offset where the element data starts
+    """
+    elements = []
+    comments = []
+    fmt = None
+    with open(path, "rb") as fid:
+        if fid.readline().strip() != b"ply":
+            raise ValueError(f"{path} is not a ply file")
+        while True:
+            line = fid.readline()
+            if not line:
+                raise ValueError(f"{path}: unexpected end of file in ply header")
+            words = line.decode("ascii").split()
+            if not words:
+                continue
+            if words[0] == "end_header":
+                break
+            elif words[0] == "format":
+                fmt = words[1]
+            elif words[0] in ("comment", "obj_info"):
+                comments.append(line.decode("ascii").rstrip("\r\n").split(" ", 1)[-1])
+            elif words[0] == "element":
+                elements.append(PlyElementHeader(words[1], int(words[2]), []))
+            elif words[0] == "property":
+                if words[1] == "list":
+                    raise ValueError(f"{path}: list property '{words[-1]}' is not supported")
+                elements[-1].properties.append(PlyProperty(words[2], words[1]))
+        size = fid.tell()
+
+    if fmt != "binary_little_endian":
+        raise ValueError(f"{path}: only binary_little_endian ply is supported, got {fmt}")
+    return PlyHeader(fmt, elements, comments, size)
+
+
+def element_dtype(element: PlyElementHeader) -> np.dtype:
+    return np.dtype([(p.name, "<" + PLY_TYPES[p.type]) for p in element.properties])
+
+
+def format_ply_header(count: int, dtype: np.dtype, element: str = "vertex", comments: List[str] = (),
+                      count_width: int = 0) -> bytes:
+    """
+    Build a single element binary little endian header, byte identical to what plyfile writes.
+    A non zero `count_width` zero pads the element count so it can be patched in place later.
+    """
+    lines = ["ply", "format binary_little_endian 1.0"]
+    lines += [f"comment {c}" for c in comments]
+    lines.append(f"element {element} {count:0{count_width}d}")
+    for name in dtype.names:
+        lines.append(f"property {NUMPY_TO_PLY[dtype[name].str[1:]]} {name}")
+    lines.append("end_header")
+    return ("\n".join(lines) + "\n").encode("ascii")
+
+
+def replace_vertex_count(header_bytes: bytes, count: int) -> bytes:
+    """
+    The raw header of a ply file with its vertex count set to `count`, everything else kept as is.
+    """
+    header_bytes, found = re.subn(rb"^element vertex \d+", b"element vertex %d" % count, header_bytes,
+                                  count=1, flags=re.MULTILINE)
+    if not found:
+        raise ValueError("ply header has no vertex element")
+    return header_bytes
+
+
+def vertex_element(header: PlyHeader):
+    """
+    :return: (PlyElementHeader of the vertex element, byte offset of its data in the file)
+    """
+    offset = header.size
+    for element in header.elements:
+        if element.name == "vertex":
+            return element, offset
+        offset += element_dtype(element).itemsize * element.count
+    raise ValueError("ply has no vertex element")
+
+
+def memmap_vertices(path: str, mode: str = "c"):
+    """
+    Memory-map the vertex element of a ply file as one structured array.
+
+    The default copy-on-write mode keeps the file untouched: pages are read lazily and
+    only copied into private memory once they are written.
+
+    :return: (PlyHeader, np.memmap of shape [n])
+    """
+    header = read_ply_header(path)
+    element, offset = vertex_element(header)
+    vertices = np.memmap(path, dtype=element_dtype(element), mode=mode, offset=offset, shape=(element.count,))
+    return header, vertices
+
+
+def iter_vertex_chunks(path: str, chunk_size: int):
+    """
+    Read the vertex element sequentially, yielding structured arrays of at most `chunk_size` rows.
+    Each chunk is a private in-memory copy, so memory is bounded by the chunk size.
+    """
+    header = read_ply_header(path)
+    element, offset = vertex_element(header)
+    dtype = element_dtype(element)
+    with open(path, "rb") as fid:
+        fid.seek(offset)
+        for start in range(0, element.count, chunk_size):
+            count = min(chunk_size, element.count - start)
+            rows = np.fromfile(fid, dtype=dtype, count=count)
+            if len(rows) != count:
+                raise ValueError(f"{path}: truncated vertex data, expected {element.count} rows")
+            yield rows
+
+
+def sorted_property_names(names: List[str], prefix: str) -> List[str]:
+    names = [name for name in names if name.startswith(prefix)]
+    return sorted(names, key=lambda x: int(x.split('_')[-1]))
+
+
+def gaussian_property_names(num_rest: int) -> List[str]:
+    """
+    Vertex property order of a 3DGS ply as written by the reference implementation and gsplat.
+
+    :param num_rest: number of f_rest_* properties, 3 * ((sh_degree + 1) ** 2 - 1)
+    """
+    names = ['x', 'y', 'z', 'nx', 'ny', 'nz', 'f_dc_0', 'f_dc_1', 'f_dc_2']
+    names += [f'f_rest_{i}' for i in range(num_rest)]
+    names += ['opacity', 'scale_0', 'scale_1', 'scale_2', 'rot_0', 'rot_1', 'rot_2', 'rot_3']
+    return names
+
+
+def sh_degree_from_num_rest(num_rest: int) -> int:
+    """
+    SH degree of a 3DGS ply from its number of f_rest_* properties (0, 9, 24 or 45).
+    """
+    degree = int(round(np.sqrt(num_rest / 3 + 1))) - 1
+    if 3 * ((degree + 1) ** 2 - 1) != num_rest:
+        raise ValueError(f"{num_rest} f_rest_* properties do not match any SH degree")
+    return degree
+
+
+def fields_view(vertices: np.ndarray, names: List[str]) -> np.ndarray:
+    """
+    [n, len(names)] view over structured fields. No copy is made as long as the fields
+    share one dtype and are evenly spaced in the record, which is the case for every
+    attribute group of a 3DGS ply; otherwise numpy falls back to a copy.
+    """
+    return rfn.structured_to_unstructured(vertices[names], copy=False)
+
+
+# rows per chunk when streaming vertices to or from disk, ~16 MB for a degree 3 3DGS row
+DEFAULT_CHUNK_SIZE = 1 << 16
+
+
+def pack_rows(dtype: np.dtype, groups, start: int, stop: int, order: np.ndarray = None) -> np.ndarray:
+    """
+    Fill rows [start, stop) of a structured vertex array, one vectorized copy per group.
+
+    :param dtype: structured dtype of one vertex row
+    :param groups: list of (property names, array [n, len(names)]), the array may be None for zeros
+    :param order: optional permutation, row i is then taken from `array[order[i]]`
+    """
+    rows = np.zeros(stop - start, dtype=dtype)
+    index = slice(start, stop) if order is None else order[start:stop]
+    for names, array in groups:
+        if array is None or len(names) == 0:
+            continue
+        fields_view(rows, names)[...] = array[index].reshape((stop - start, len(names)))
+    return rows
+
+
+def write_ply(path: str, dtype: np.dtype, groups, count: int, chunk_size: int = DEFAULT_CHUNK_SIZE,
+              comments: List[str] = (), order: np.ndarray = None):
+    """
+    Write a single vertex element ply straight from the attribute arrays, `chunk_size` rows at a time,
+    so no python object is created per vertex and the full row array never exists in memory.
+
+    :param order: optional permutation of the rows, see `pack_rows`
+    """
+    with open(path, "wb") as fid:
+        fid.write(format_ply_header(count, dtype, comments=comments))
+        for start in range(0, count, chunk_size):
+            pack_rows(dtype, groups, start, min(start + chunk_size, count), order).tofile(fid)
+
+
+def bounds_path(ply_path: str) -> str:
+    return ply_path + ".bounds.npz"
+
+
+def save_chunk_bounds(path: str, xyz: np.ndarray, chunk_size: int):
+    """
+    Sidecar table of the AABB of every run of `chunk_size` rows of `xyz` (in file order), so a reader
+    can skip whole blocks of a spatially sorted ply. The ply itself stays a plain 3DGS file.
+    """
+    starts = np.arange(0, len(xyz), chunk_size)
+    bounds = np.stack([np.minimum.reduceat(xyz, starts, axis=0), np.maximum.reduceat(xyz, starts, axis=0)], axis=1)
+    np.savez(path, chunk_size=chunk_size, bounds=bounds.astype(np.float32))
+
+
+def load_chunk_bounds(path: str):
+    """
+    :return: (chunk_size, bounds [num chunks, 2, 3] as min and max corners)
+    """
+    with np.load(path) as data:
+        return int(data["chunk_size"]), data["bounds"]
+
+
+def copy_file_bytes(src, dst, offset: int, count: int, block_size: int = 1 << 26):
+    """
+    Copy `count` bytes of the open file `src` starting at `offset` to the current position of `dst`.
+    The copy stays in the kernel (`os.copy_file_range`, else `os.sendfile`) when the platform and
+    file system allow it, otherwise it falls back to `block_size` reads and writes.
+    """
+    dst.flush()
+    position = dst.tell()
+    end = offset + count
+    try:
+        while offset < end:
+            size = min(block_size, end - offset)
+            if hasattr(os, "copy_file_range"):
+                copied = os.copy_file_range(src.fileno(), dst.fileno(), size, offset, position)
+            else:
+                os.lseek(dst.fileno(), position, os.SEEK_SET)
+                copied = os.sendfile(dst.fileno(), src.fileno(), offset, size)
+            if copied == 0:
+                raise ValueError(f"{src.name} ends {end - offset} bytes early")
+            offset += copied
+            position += copied
+    except OSError:
+        # e.g. cross file system copy on older kernels, or no sendfile to regular files
+        src.seek(offset)
+        dst.seek(position)
+        while offset < end:
+            block = src.read(min(block_size, end - offset))
+            if not block:
+                raise ValueError(f"{src.name} ends {end - offset} bytes early")
+            dst.write(block)
+            offset += len(block)
+            position += len(block)
+    dst.seek(position)
+
+
+class StreamingPlyWriter:
+    """
+    Append vertex chunks to a ply whose final vertex count is unknown when the header is written.
+    The count is written zero padded and patched in place on `close`.
+
+        with StreamingPlyWriter(path, dtype) as writer:
+            for rows in chunks:
+                writer.write(rows)
+    """
+    COUNT_WIDTH = 12
+
+    def __init__(self, path: str, dtype: np.dtype, comments: List[str] = ()):
+        header = format_ply_header(0, dtype, comments=comments, count_width=self.COUNT_WIDTH)
+        self.dtype = dtype
+        self.count = 0
+        self.count_offset = header.index(b"element vertex ") + len(b"element vertex ")
+        self.fid = open(path, "wb")
+        self.fid.write(header)
+
+    def write(self, rows: np.ndarray):
+        if rows.dtype != self.dtype:
+            raise ValueError(f"row dtype {rows.dtype} does not match the header dtype {self.dtype}")
+        rows.tofile(self.fid)
+        self.count += len(rows)
+
+    def close(self):
+        if self.fid.closed:
+            return
+        self.fid.seek(self.count_offset)
+        self.fid.write(f"{self.count:0{self.COUNT_WIDTH}d}".encode("ascii"))
+        self.fid.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Post-hoc pruning of a splat to a gaussian count or file size budget.
+
+    $ python pruning.py garden_canvas_merged.ply garden_small.ply --max-mb 100
+
+Every gaussian is scored by its opacity times its volume, sigmoid(opacity) * exp(sum of log scales),
+and the highest scoring ones are kept with `np.argpartition` (no full sort). The retained energy is
+the kept share of the summed scores.
+"""
+import argparse
+
+import numpy as np
+
+from gs_utils import sigmoid
+
+
+def importance_scores(opacities: np.ndarray, scales: np.ndarray) -> np.ndarray:
+    """
+    :param opacities: [n, 1] logits, as stored in the ply
+    :param scales: [n, 3] log scales, as stored in the ply
+    :return: [n] float64 scores
+    """
+    log_volume = np.sum(scales, axis=1, dtype=np.float64)
+    if len(log_volume) == 0:
+        return log_volume
+    # shift by the largest so huge scales do not overflow and tiny ones do not all underflow to 0,
+    # only the ranking and ratios matter
+    return sigmoid(opacities.reshape(-1).astype(np.float64)) * np.exp(log_volume - log_volume.max())
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    :return: indices of the `k` highest scores, sorted ascending so the kept gaussians stay in file order
+    """
+    if k >= len(scores):
+        return np.arange(len(scores))
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    return np.sort(np.argpartition(scores, len(scores) - k)[len(scores) - k:])
+
+
+def budget_count(row_bytes: int, max_bytes: int, header_bytes: int = 2048) -> int:
+    """
+    Gaussians that fit in `max_bytes`, with `header_bytes` kept aside for the ply header.
+    """
+    return max(0, (max_bytes - header_bytes) // row_bytes)
+
+
+def main():
+    from insert_canvas_in_garden import GsData
+
+    parser = argparse.ArgumentParser(description="Keep the most important gaussians of a 3DGS ply")
+    parser.add_argument("input")
+    parser.add_argument("output")
+    budget = parser.add_mutually_exclusive_group(required=True)
+    budget.add_argument("--count", type=int, help="number of gaussians to keep")
+    budget.add_argument("--max-mb", type=float, help="output file size budget in MB")
+    args = parser.parse_args()
+
+    gs = GsData()
+    gs.load_from_ply_packed(args.input)
+    max_bytes = None if args.max_mb is None else int(args.max_mb * 2**20)
+    pruned, report = gs.prune(count=args.count, max_bytes=max_bytes)
+    pruned.save_to_ply(args.output)
+    print(f"Kept {report['kept']} of {report['total']} gaussians, "
+          f"{100 * report['energy_retained']:.2f}% of the energy")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Batched quaternion and rotation matrix helpers.
+
+All quaternions are wxyz (scalar first), as in COLMAP and the 3DGS ply `rot_*` properties, and
+every function takes any number of leading batch dimensions: a single [4] quaternion gives a single
+[3, 3] matrix, [n, 4] gives [n, 3, 3].
+"""
+import numpy as np
+
+
+def qvec2rotmat(qvec: np.ndarray) -> np.ndarray:
+    """
+    :param qvec: [..., 4] unit quaternions
+    :return: [..., 3, 3]
+    """
+    qvec = np.asarray(qvec)
+    w, x, y, z = qvec[..., 0], qvec[..., 1], qvec[..., 2], qvec[..., 3]
+    rot_mat = np.empty(qvec.shape[:-1] + (3, 3), dtype=np.result_type(qvec.dtype, np.float32))
+    rot_mat[..., 0, 0] = 1 - 2 * y ** 2 - 2 * z ** 2
+    rot_mat[..., 0, 1] = 2 * x * y - 2 * w * z
+    rot_mat[..., 0, 2] = 2 * z * x + 2 * w * y
+    rot_mat[..., 1, 0] = 2 * x * y + 2 * w * z
+    rot_mat[..., 1, 1] = 1 - 2 * x ** 2 - 2 * z ** 2
+    rot_mat[..., 1, 2] = 2 * y * z - 2 * w * x
+    rot_mat[..., 2, 0] = 2 * z * x - 2 * w * y
+    rot_mat[..., 2, 1] = 2 * y * z + 2 * w * x
+    rot_mat[..., 2, 2] = 1 - 2 * x ** 2 - 2 * y ** 2
+    return rot_mat
+
+
+def rotmat2qvec(rot_mat: np.ndarray) -> np.ndarray:
+    """
+    Shepperd's method: the quaternion is recovered from whichever of w, x, y, z has the largest
+    magnitude (largest of trace and diagonal), so no branch divides by a small number.
+
+    :param rot_mat: [..., 3, 3] rotation matrices
+    :return: [..., 4] unit quaternions with w >= 0
+    """
+    rot_mat = np.asarray(rot_mat)
+    m = rot_mat.reshape((-1, 3, 3))
+    m00, m01, m02 = m[:, 0, 0], m[:, 0, 1], m[:, 0, 2]
+    m10, m11, m12 = m[:, 1, 0], m[:, 1, 1], m[:, 1, 2]
+    m20, m21, m22 = m[:, 2, 0], m[:, 2, 1], m[:, 2, 2]
+
+    # 4 * (w^2, x^2, y^2, z^2) - 1 up to a common term, largest one picks the branch
+    diagonal = np.stack([m00 + m11 + m22, m00 - m11 - m22, m11 - m00 - m22, m22 - m00 - m11], axis=-1)
+    branch = np.argmax(diagonal, axis=-1)
+    # each row is 4 * q_i * (w, x, y, z) for the branch i
+    candidates = np.stack([
+        np.stack([1 + diagonal[:, 0], m21 - m12, m02 - m20, m10 - m01], axis=-1),
+        np.stack([m21 - m12, 1 + diagonal[:, 1], m01 + m10, m02 + m20], axis=-1),
+        np.stack([m02 - m20, m01 + m10, 1 + diagonal[:, 2], m12 + m21], axis=-1),
+        np.stack([m10 - m01, m02 + m20, m12 + m21, 1 + diagonal[:, 3]], axis=-1),
+    ], axis=1)
+    qvec = np.take_along_axis(candidates, branch[:, None, None], axis=1)[:, 0]
+    qvec = normalize(qvec)
+    qvec *= np.where(qvec[:, :1] < 0, -1.0, 1.0).astype(qvec.dtype)
+    return qvec.reshape(rot_mat.shape[:-2] + (4,))
+
+
+def multiply(q0: np.ndarray, q1: np.ndarray) -> np.ndarray:
+    """
+    Hamilton product q0 * q1 (apply q1, then q0), broadcast over leading dimensions.
+    """
+    w0, x0, y0, z0 = np.split(q0, 4, axis=-1)
+    w1, x1, y1, z1 = np.split(q1, 4, axis=-1)
+    return np.concatenate((
+        -x0 * x1 - y0 * y1 - z0 * z1 + w0 * w1,
+        x0 * w1 + y0 * z1 - z0 * y1 + w0 * x1,
+        -x0 * z1 + y0 * w1 + z0 * x1 + w0 * y1,
+        x0 * y1 - y0 * x1 + z0 * w1 + w0 * z1,
+    ), axis=-1)
+
+
+def normalize(qvec: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+    """
+    :param out: e.g. `qvec` itself to normalize in place
+    """
+    return np.divide(qvec, np.linalg.norm(qvec, axis=-1, keepdims=True), out=out)
+
+
+def slerp(q0: np.ndarray, q1: np.ndarray, t) -> np.ndarray:
+    """
+    Spherical linear interpolation along the shortest arc, broadcast over leading dimensions.
+
+    :param t: scalar or [...] interpolation parameter, 0 gives q0 and 1 gives q1
+    """
+    q0 = normalize(np.asarray(q0, dtype=np.float64))
+    q1 = normalize(np.asarray(q1, dtype=np.float64))
+    t = np.asarray(t, dtype=np.float64)[..., None]
+
+    dot = np.sum(q0 * q1, axis=-1, keepdims=True)
+    # q and -q are the same rotation, go the short way
+    q1 = np.where(dot < 0, -q1, q1)
+    dot = np.abs(dot)
+
+    theta = np.arccos(np.clip(dot, -1.0, 1.0))
+    sin_theta = np.sin(theta)
+    # nearly parallel quaternions: sin(theta) -> 0, linear interpolation is exact to rounding
+    linear = sin_theta < 1e-6
+    safe_sin = np.where(linear, 1.0, sin_theta)
+    w0 = np.where(linear, 1.0 - t, np.sin((1.0 - t) * theta) / safe_sin)
+    w1 = np.where(linear, t, np.sin(t * theta) / safe_sin)
+    return normalize(w0 * q0 + w1 * q1)
@@ -0,0 +1,106 @@
+"""
+Rotation of real spherical harmonics (degrees 1-3) in pure numpy.
+
+The basis is the one 3DGS evaluates colors with (`eval_sh` in the reference implementation), so
+rotating an object by R is exact by construction: the rotated coefficients c' must satisfy
+Y(d) c' = Y(R^T d) c for every view direction d. Each band is a linear space of dimension 2l+1,
+so solving that identity in the least squares sense on a fixed set of well spread directions gives
+the band's rotation matrix exactly (up to float rounding), for any number of rotations at once.
+"""
+import functools
+
+import numpy as np
+
+from parallel import PARALLEL_CHUNK_SIZE, run_chunked
+
+C1 = 0.4886025119029199
+C2 = [1.0925484305920792, -1.0925484305920792, 0.31539156525252005, -1.0925484305920792, 0.5462742152960396]
+C3 = [-0.5900435899266435, 2.890611442640554, -0.4570457994644658, 0.3731763325901154,
+      -0.4570457994644658, 1.445305721320277, -0.5900435899266435]
+
+NUM_DIRECTIONS = 64
+
+
+def band_basis(dirs: np.ndarray, degree: int) -> np.ndarray:
+    """
+    3DGS real SH basis of a single band evaluated at unit directions [..., 3].
+
+    :return: [..., 2 * degree + 1]
+    """
+    x, y, z = dirs[..., 0], dirs[..., 1], dirs[..., 2]
+    if degree == 1:
+        return np.stack([-C1 * y, C1 * z, -C1 * x], axis=-1)
+    xx, yy, zz = x * x, y * y, z * z
+    if degree == 2:
+        return np.stack([
+            C2[0] * x * y,
+            C2[1] * y * z,
+            C2[2] * (2.0 * zz - xx - yy),
+            C2[3] * x * z,
+            C2[4] * (xx - yy),
+        ], axis=-1)
+    if degree == 3:
+        return np.stack([
+            C3[0] * y * (3 * xx - yy),
+            C3[1] * x * y * z,
+            C3[2] * y * (4 * zz - xx - yy),
+            C3[3] * z * (2 * zz - 3 * xx - 3 * yy),
+            C3[4] * x * (4 * zz - xx - yy),
+            C3[5] * z * (xx - yy),
+            C3[6] * x * (xx - 3 * yy),
+        ], axis=-1)
+    raise ValueError(f"SH degree {degree} is not supported, only 1-3")
+
+
+@functools.lru_cache(maxsize=None)
+def _sample_directions() -> np.ndarray:
+    # fibonacci sphere, deterministic and well spread
+    i = np.arange(NUM_DIRECTIONS) + 0.5
+    phi = np.arccos(1.0 - 2.0 * i / NUM_DIRECTIONS)
+    theta = np.pi * (1.0 + 5.0 ** 0.5) * i
+    return np.stack([np.cos(theta) * np.sin(phi), np.sin(theta) * np.sin(phi), np.cos(phi)], axis=-1)
+
+
+@functools.lru_cache(maxsize=None)
+def _band_pinv(degree: int) -> np.ndarray:
+    return np.linalg.pinv(band_basis(_sample_directions(), degree))
+
+
+def sh_rotation_matrix(rotation_matrix: np.ndarray, degree: int = 3) -> np.ndarray:
+    """
+    Block diagonal matrix rotating SH bands 1..`degree` by `rotation_matrix`.
+
+    :param rotation_matrix: [3, 3], or [k, 3, 3] for k rotations at once
+    :return: [K, K] (or [k, K, K]) with K = (degree + 1) ** 2 - 1 coefficients per channel
+    """
+    rotation_matrix = np.asarray(rotation_matrix, dtype=np.float64)
+    num_coeffs = (degree + 1) ** 2 - 1
+    D = np.zeros(rotation_matrix.shape[:-2] + (num_coeffs, num_coeffs))
+    # rows of dirs @ R are R^T d
+    rotated_dirs = _sample_directions() @ rotation_matrix
+    for band in range(1, degree + 1):
+        lo, hi = band ** 2 - 1, (band + 1) ** 2 - 1
+        D[..., lo:hi, lo:hi] = _band_pinv(band) @ band_basis(rotated_dirs, band)
+    return D
+
+
+def rotate_sh(features_rest: np.ndarray, D: np.ndarray, chunk_size: int = PARALLEL_CHUNK_SIZE,
+              workers: int = None) -> np.ndarray:
+    """
+    Rotate SH coefficients in place with one block diagonal gemm per chunk.
+
+    :param features_rest: [n, 3, K] channel major coefficients, as stored by GsData
+    :param D: `sh_rotation_matrix` output for a single rotation, at least [K, K]
+    :param workers: threads the chunks are spread over, see `parallel.run_chunked`
+    """
+    num_coeffs = features_rest.shape[2]
+    if num_coeffs == 0:
+        return features_rest
+    D_t = D[:num_coeffs, :num_coeffs].T.astype(features_rest.dtype)
+
+    def rotate_chunk(rows: slice):
+        chunk = features_rest[rows]
+        chunk[...] = (chunk.reshape((-1, num_coeffs)) @ D_t).reshape(chunk.shape)
+
+    run_chunked(rotate_chunk, features_rest.shape[0], chunk_size=chunk_size, workers=workers)
+    return features_rest
@@ -0,0 +1,195 @@
+"""
+Uniform voxel grid over gaussian (or point) positions for region queries.
+
+Points are sorted by the Morton code of their cell, and every occupied cell stores the offset of
+its first point in that order (CSR style). A query only visits the cells overlapping its bounding
+box, then tests the points of those cells exactly:
+
+    index = SpatialIndex.build(gs.xyz)
+    near = gs.select(index.query_sphere(center, 0.5))
+
+The arrays are saved as one .npz, e.g. next to the GsData cache (see `GsData.spatial_index`).
+"""
+import numpy as np
+
+from morton import MORTON_BITS, morton_encode
+
+INDEX_NAME = "spatial_index.npz"
+INDEX_VERSION = 2
+# a cell and its 26 neighbors
+_NEIGHBOR_OFFSETS = np.stack(np.meshgrid(*[np.arange(-1, 2)] * 3, indexing="ij"), axis=-1).reshape((-1, 3))
+
+
+def _bounds(xyz: np.ndarray):
+    if len(xyz) == 0:
+        return np.zeros(3), np.zeros(3)
+    return xyz.min(axis=0).astype(np.float64), xyz.max(axis=0).astype(np.float64)
+
+
+class SpatialIndex:
+    def __init__(self, xyz: np.ndarray, origin: np.ndarray, cell_size: float, cell_coords: np.ndarray,
+                 cell_starts: np.ndarray, order: np.ndarray, upper: np.ndarray = None):
+        """
+        :param xyz: [n, 3] positions the index was built on, only read by the exact tests
+        :param origin: lower corner of the bounding box of `xyz` at build time, `upper` the upper one
+        :param cell_coords: [m, 3] integer coordinates of the occupied cells, in Morton order
+        :param cell_starts: [m + 1] offsets into `order` of the points of every cell
+        :param order: [n] point indices sorted by cell
+        """
+        self.xyz = xyz
+        self.origin = np.asarray(origin, dtype=np.float64)
+        self.upper = self.origin if upper is None else np.asarray(upper, dtype=np.float64)
+        self.cell_size = float(cell_size)
+        self.cell_coords = cell_coords
+        self.cell_keys = morton_encode(cell_coords)
+        self.cell_starts = cell_starts
+        self.order = order
+
+    @classmethod
+    def build(cls, xyz: np.ndarray, cell_size: float = None, points_per_cell: int = 32) -> "SpatialIndex":
+        """
+        :param cell_size: edge length of the cubic cells, default sized for about `points_per_cell`
+            points per cell if they filled their bounding box uniformly
+        """
+        lo, hi = _bounds(xyz)
+        if len(xyz) == 0:
+            return cls(xyz, lo, cell_size or 1.0, np.zeros((0, 3), dtype=np.int32), np.zeros(1, dtype=np.int64),
+                       np.zeros(0, dtype=np.int64), hi)
+        extent = float(np.max(hi - lo)) or 1.0
+        if cell_size is None:
+            volume = float(np.prod(np.maximum(hi - lo, extent * 1e-3)))
+            cell_size = (volume * points_per_cell / max(len(xyz), 1)) ** (1.0 / 3.0)
+        # Morton codes hold 21 bits per axis
+        cell_size = max(cell_size, extent / ((1 << MORTON_BITS) - 2))
+
+        cells = np.floor((xyz - lo) / cell_size).astype(np.int64)
+        keys = morton_encode(cells)
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+        first = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        cell_starts = np.append(first, len(keys)).astype(np.int64)
+        return cls(xyz, lo, cell_size, cells[order[first]].astype(np.int32), cell_starts, order, hi)
+
+    def save(self, path: str, tag: str = ""):
+        """
+        :param tag: identifies the positions the index belongs to, checked by `load`
+        """
+        np.savez(path, version=INDEX_VERSION, tag=tag, count=len(self.order), origin=self.origin, upper=self.upper,
+                 cell_size=self.cell_size, cell_coords=self.cell_coords, cell_starts=self.cell_starts,
+                 order=self.order)
+
+    @classmethod
+    def load(cls, path: str, xyz: np.ndarray, tag: str = ""):
+        """
+        :return: the saved index over `xyz`, or None if it is missing, outdated or for other positions;
+            positions moved since the save (e.g. by an in place `apply_transform`) are caught by their
+            bounding box
+        """
+        try:
+            data = np.load(path)
+        except (OSError, ValueError):
+            return None
+        with data:
+            if int(data["version"]) != INDEX_VERSION or str(data["tag"]) != tag or int(data["count"]) != len(xyz):
+                return None
+            lo, hi = _bounds(xyz)
+            if not (np.array_equal(lo, data["origin"]) and np.array_equal(hi, data["upper"])):
+                return None
+            return cls(xyz, data["origin"], float(data["cell_size"]), data["cell_coords"], data["cell_starts"],
+                       data["order"], data["upper"])
+
+    def _cells_overlapping(self, lo: np.ndarray, hi: np.ndarray) -> np.ndarray:
+        """
+        :return: indices of the occupied cells that overlap the box [lo, hi]
+        """
+        cell_lo = np.floor((np.asarray(lo) - self.origin) / self.cell_size).astype(np.int64)
+        cell_hi = np.floor((np.asarray(hi) - self.origin) / self.cell_size).astype(np.int64)
+        cell_lo = np.maximum(cell_lo, 0)
+        cell_hi = np.minimum(cell_hi, self.cell_coords.max(axis=0, initial=-1))
+        if np.any(cell_hi < cell_lo):
+            return np.zeros(0, dtype=np.int64)
+
+        num_cells = int(np.prod(cell_hi - cell_lo + 1))
+        if num_cells > len(self.cell_keys):
+            # large box: cheaper to test every occupied cell than to enumerate the box
+            inside = np.all((self.cell_coords >= cell_lo) & (self.cell_coords <= cell_hi), axis=1)
+            return np.flatnonzero(inside)
+        axes = [np.arange(cell_lo[i], cell_hi[i] + 1) for i in range(3)]
+        box_cells = np.stack(np.meshgrid(*axes, indexing="ij"), axis=-1).reshape((-1, 3))
+        _, cells = self._lookup(box_cells)
+        return cells
+
+    def _lookup(self, coords: np.ndarray):
+        """
+        :param coords: [k, 3] cell coordinates within [0, cell_coords.max(axis=0)]
+        :return: (mask of the `coords` that are occupied, indices of those cells)
+        """
+        keys = morton_encode(coords)
+        found = np.minimum(np.searchsorted(self.cell_keys, keys), len(self.cell_keys) - 1)
+        occupied = self.cell_keys[found] == keys
+        return occupied, found[occupied]
+
+    def _cell_points(self, cells: np.ndarray):
+        """
+        :return: (positions in `order` of the points of `cells`, cell by cell; points per cell)
+        """
+        starts = self.cell_starts[cells]
+        lengths = self.cell_starts[cells + 1] - starts
+        # concatenated aranges [starts[i], starts[i] + lengths[i])
+        offsets = np.cumsum(lengths) - lengths
+        return np.arange(lengths.sum()) + np.repeat(starts - offsets, lengths), lengths
+
+    def candidates(self, lo, hi) -> np.ndarray:
+        """
+        :return: indices of the points in the cells overlapping the box [lo, hi], a superset of the
+            points inside it
+        """
+        positions, _ = self._cell_points(self._cells_overlapping(lo, hi))
+        return self.order[positions]
+
+    def neighbors(self, xyz: np.ndarray):
+        """
+        Batched neighborhoods: the points in the cell of each of `xyz` and in the 26 cells around it,
+        a superset of the points within `cell_size` of it.
+
+        :return: (query, candidate) index pairs, into `xyz` and into the indexed points
+        """
+        cells = np.floor((xyz - self.origin) / self.cell_size).astype(np.int64)
+        top = self.cell_coords.max(axis=0, initial=-1)
+        queries, candidates = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)]
+        for offset in _NEIGHBOR_OFFSETS:
+            coords = cells + offset
+            inside = np.flatnonzero(np.all((coords >= 0) & (coords <= top), axis=1))
+            occupied, found = self._lookup(coords[inside])
+            positions, lengths = self._cell_points(found)
+            queries.append(np.repeat(inside[occupied], lengths))
+            candidates.append(self.order[positions])
+        return np.concatenate(queries), np.concatenate(candidates)
+
+    def query_aabb(self, lo, hi) -> np.ndarray:
+        """
+        :return: sorted indices of the points with lo <= xyz <= hi
+        """
+        index = self.candidates(lo, hi)
+        xyz = self.xyz[index]
+        return np.sort(index[np.all((xyz >= lo) & (xyz <= hi), axis=1)])
+
+    def query_sphere(self, center, radius: float) -> np.ndarray:
+        center = np.asarray(center, dtype=np.float64)
+        index = self.candidates(center - radius, center + radius)
+        distance2 = np.sum((self.xyz[index] - center) ** 2, axis=1)
+        return np.sort(index[distance2 <= radius * radius])
+
+    def query_obb(self, center, rotation, half_extents) -> np.ndarray:
+        """
+        Oriented box: the points x with |rotation^T (x - center)| <= half_extents on every axis.
+
+        :param rotation: [3, 3], columns are the box axes in world coordinates
+        """
+        center = np.asarray(center, dtype=np.float64)
+        rotation = np.asarray(rotation, dtype=np.float64)
+        half_extents = np.asarray(half_extents, dtype=np.float64)
+        reach = np.abs(rotation) @ half_extents
+        index = self.candidates(center - reach, center + reach)
+        local = (self.xyz[index] - center) @ rotation
+        return np.sort(index[np.all(np.abs(local) <= half_extents, axis=1)])
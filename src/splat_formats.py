@@ -0,0 +1,111 @@
+"""
+Compact exporters for web viewers.
+
+    .splat  antimatter15/splat: 32 bytes per gaussian, position and scale as float32, rgba and the
+            quaternion as uint8
+    .spz    Niantic spz (version 2): gzip of a 16 byte header followed by attribute planes, positions
+            as 24 bit fixed point, everything else as uint8
+
+Both keep the coordinate frame of the ply they come from.
+"""
+import gzip
+import struct
+
+import numpy as np
+
+from gs_utils import SH_C0, sigmoid
+
+SPLAT_DTYPE = np.dtype([
+    ('position', '<f4', 3),
+    ('scale', '<f4', 3),
+    ('color', 'u1', 4),
+    ('rotation', 'u1', 4),
+])
+
+SPZ_MAGIC = 0x5053474e  # "NGSP"
+SPZ_VERSION = 2
+SPZ_COLOR_SCALE = 0.15
+
+
+def to_uint8(value: np.ndarray) -> np.ndarray:
+    return np.clip(np.round(value), 0, 255).astype(np.uint8)
+
+
+def select_gaussians(gs, sort: bool = True, min_alpha: float = 1 / 255) -> np.ndarray:
+    """
+    Indices of the gaussians to export: those with sigmoid(opacity) >= `min_alpha`, most opaque
+    first if `sort`, so progressive viewers draw the gaussians that matter first.
+    """
+    alpha = sigmoid(gs.opacities.reshape(-1))
+    indices = np.flatnonzero(alpha >= min_alpha)
+    if sort:
+        indices = indices[np.argsort(-alpha[indices], kind="stable")]
+    return indices
+
+
+def _normalized_rotations(gs, indices: np.ndarray) -> np.ndarray:
+    q = gs.rotations[indices].astype(np.float32)
+    return q / np.linalg.norm(q, axis=1, keepdims=True)
+
+
+def splat_records(gs, sort: bool = True, min_alpha: float = 1 / 255) -> np.ndarray:
+    indices = select_gaussians(gs, sort, min_alpha)
+    n = len(indices)
+
+    records = np.empty(n, dtype=SPLAT_DTYPE)
+    records['position'] = gs.xyz[indices]
+    records['scale'] = np.exp(gs.scales[indices])
+    records['color'][:, :3] = to_uint8((0.5 + SH_C0 * gs.features_dc[indices].reshape((n, 3))) * 255)
+    records['color'][:, 3] = to_uint8(sigmoid(gs.opacities[indices].reshape(n)) * 255)
+    records['rotation'] = to_uint8(_normalized_rotations(gs, indices) * 128 + 128)
+    return records
+
+
+def write_splat(path: str, gs, sort: bool = True, min_alpha: float = 1 / 255) -> int:
+    """
+    :return: number of gaussians written
+    """
+    records = splat_records(gs, sort, min_alpha)
+    records.tofile(path)
+    return len(records)
+
+
+def _quantize_sh(value: np.ndarray, bucket_size: int) -> np.ndarray:
+    q = np.round(value * 128.0).astype(np.int32) + 128
+    q = (q + bucket_size // 2) // bucket_size * bucket_size
+    return np.clip(q, 0, 255).astype(np.uint8)
+
+
+def write_spz(path: str, gs, sort: bool = True, min_alpha: float = 1 / 255, fractional_bits: int = 12) -> int:
+    """
+    :param fractional_bits: fixed point precision of the positions, 12 gives ~0.25 mm and a range of +-2 km
+    :return: number of gaussians written
+    """
+    indices = select_gaussians(gs, sort, min_alpha)
+    n = len(indices)
+
+    fixed = np.round(gs.xyz[indices].astype(np.float64) * (1 << fractional_bits))
+    fixed = np.clip(fixed, -(1 << 23), (1 << 23) - 1).astype('<i4')
+    positions = fixed.view(np.uint8).reshape((n, 3, 4))[:, :, :3]  # low 3 bytes, little endian
+
+    alphas = to_uint8(sigmoid(gs.opacities[indices].reshape(n)) * 255)
+    colors = to_uint8(gs.features_dc[indices].reshape((n, 3)) * (SPZ_COLOR_SCALE * 255) + 0.5 * 255)
+    scales = to_uint8((gs.scales[indices] + 10.0) * 16.0)
+
+    # xyz of the quaternion with w >= 0, w is recovered from the unit norm
+    q = _normalized_rotations(gs, indices)
+    q *= np.where(q[:, :1] < 0, -1.0, 1.0)
+    rotations = to_uint8(q[:, 1:] * 127.5 + 127.5)
+
+    # spz stores SH coefficient major with rgb inner, degree 1 at 5 bits and higher bands at 4 bits
+    sh_degree = gs.sh_degrees if gs.features_rest.size > 0 else 0
+    num_coeffs = (sh_degree + 1) ** 2 - 1
+    sh = gs.features_rest[indices][:, :, :num_coeffs].transpose((0, 2, 1))
+    sh = np.concatenate([_quantize_sh(sh[:, :3], 8), _quantize_sh(sh[:, 3:], 16)], axis=1)
+
+    header = struct.pack('<IIIBBBB', SPZ_MAGIC, SPZ_VERSION, n, sh_degree, fractional_bits, 0, 0)
+    with gzip.open(path, 'wb') as fid:
+        fid.write(header)
+        for plane in (positions, alphas, colors, scales, rotations, sh):
+            fid.write(np.ascontiguousarray(plane).tobytes())
+    return n